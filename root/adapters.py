@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+
+SYSFS_BLUETOOTH = "/sys/class/bluetooth"
+
+
+class LinuxAdapterBackend:
+    """Liệt kê các HCI controller đang có trên Linux (hci0, hci1, ...)."""
+
+    def list_adapters(self):
+        try:
+            names = os.listdir(SYSFS_BLUETOOTH)
+        except OSError:
+            return []
+        return sorted(name for name in names if re.fullmatch(r"hci\d+", name))
+
+
+class FakeAdapterBackend:
+    """Backend giả để thử sharding không cần dongle thật: thêm/bớt adapter bằng tay."""
+
+    def __init__(self, adapters=()):
+        self.adapters = set(adapters)
+
+    def list_adapters(self):
+        return sorted(self.adapters)
+
+    def plug(self, adapter):
+        self.adapters.add(adapter)
+
+    def unplug(self, adapter):
+        self.adapters.discard(adapter)
+
+
+class AdapterShardManager:
+    """Chia các MAC cho nhiều adapter BLE theo tải và chất lượng tín hiệu.
+
+    - assign(mac): giữ adapter cũ nếu còn hoạt động và chưa quá phần chia đều, ngược lại chọn
+      adapter chưa đầy có ít kết nối nhất (hoà thì chọn RSSI mạnh hơn). Trả về None nếu
+      tất cả adapter đã đầy. RSSI theo adapter do presence scanner báo qua report_rssi()
+      (cần PRESENCE_SCAN_ENABLE hoặc ADV_INGEST_ENABLE); chưa có RSSI thì coi như -127.
+    - refresh(): cập nhật danh sách adapter, MAC của adapter bị rút được gán lại ở lần kết nối sau.
+    - rebalance(): các MAC cần chuyển khỏi adapter đang quá tải so với phần chia đều.
+    """
+
+    def __init__(self, backend, adapters, max_per_adapter):
+        self.backend = backend
+        self.configured = list(adapters)
+        self.max_per_adapter = max_per_adapter
+        self.available = []
+        self.assignments = {}
+        self.load = {}
+        self.rssi = {}
+        self.refresh()
+
+    def refresh(self):
+        present = set(self.backend.list_adapters())
+        available = [a for a in self.configured if a in present] if self.configured else sorted(present)
+        dropped = [a for a in self.available if a not in available]
+        for adapter in dropped:
+            print(f"⚠️ Adapter {adapter} đã mất, gán lại {len(self.load.get(adapter, ()))} thiết bị")
+            for mac in self.load.pop(adapter, set()):
+                self.assignments.pop(mac, None)
+        for adapter in available:
+            self.load.setdefault(adapter, set())
+        self.available = available
+        return dropped
+
+    def report_rssi(self, mac, adapter, rssi):
+        self.rssi[(mac, adapter)] = rssi
+
+    def _fair_share(self):
+        return -(-len(self.assignments) // max(len(self.available), 1))
+
+    def assign(self, mac):
+        current = self.assignments.get(mac)
+        if current in self.available and len(self.load[current]) <= self._fair_share():
+            return current
+        candidates = [a for a in self.available
+                      if a == current or len(self.load[a]) < self.max_per_adapter]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda a: (len(self.load[a] - {mac}), -self.rssi.get((mac, a), -127)))
+        if best != current:
+            self.release(mac)
+            self.assignments[mac] = best
+            self.load[best].add(mac)
+        return best
+
+    def release(self, mac):
+        adapter = self.assignments.pop(mac, None)
+        if adapter is not None and adapter in self.load:
+            self.load[adapter].discard(mac)
+
+    def rebalance(self):
+        """Trả về list (mac, adapter hiện tại) nên ngắt để kết nối lại trên adapter khác."""
+        if len(self.available) < 2:
+            return []
+        share = self._fair_share()
+        moves = []
+        for adapter in self.available:
+            extra = len(self.load[adapter]) - share
+            if extra > 0:
+                moves.extend((mac, adapter) for mac in sorted(self.load[adapter])[:extra])
+        return moves
+
+    async def monitor(self, interval, on_move=None):
+        """Định kỳ kiểm tra adapter bị rút/cắm thêm và cân bằng lại tải."""
+        while True:
+            await asyncio.sleep(interval)
+            self.refresh()
+            if on_move is None:
+                continue
+            for mac, adapter in self.rebalance():
+                self.release(mac)
+                await on_move(mac, adapter)
@@ -0,0 +1,130 @@
+"""Micro-benchmark cho các hàm mã hoá/giải mã byte trong helper.py.
+
+Mỗi hàm được chạy trên toàn bộ corpus cố định (frame location mode 0/1/2 như DWM1001 gửi,
+word operation mode, toạ độ, tham số update rate); kết quả là ns trung bình mỗi lần gọi
+(lấy min của nhiều lần lặp). So sánh với số liệu gốc trong bench_helpers_baseline.json.
+
+Ví dụ:
+    python bench_helpers.py                      # đo và so với baseline
+    python bench_helpers.py --only decode        # chỉ các benchmark có tên chứa "decode"
+    python bench_helpers.py --save-baseline      # ghi lại baseline sau khi tối ưu
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+from helper import (bit_string_to_byte_array, bits_to_bytes_array, bytes_array_to_bits,
+                    int_to_bytes_array_4_bytes, float_to_int32_bytes,
+                    unpack_location, decode_location_frame, decode_location_data, decode_location_batch,
+                    encode_location_frame)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_helpers_baseline.json")
+
+# Frame location tiêu biểu theo bố cục DWM1001 (hex, bytes.fromhex bỏ qua khoảng trắng)
+LOCATION_FRAMES = [bytes.fromhex(h) for h in (
+    # mode 0: vị trí (x, y, z mm) + quality
+    "00 c4090000 1b0f0000 e8030000 64",
+    "00 f4fdffff 88130000 32050000 3c",
+    "0000000000000000000000000000",
+    # mode 1: 4 khoảng cách
+    "01 04 0ec6 d2110000 5a 1ac6 8c0a0000 60 2fc6 c4190000 55 41c6 30080000 63",
+    # mode 1: 3 khoảng cách
+    "01 03 0ec6 b80b0000 64 1ac6 a00f0000 5f 2fc6 10270000 4b",
+    # mode 2: vị trí + 4 khoảng cách
+    "02 c4090000 1b0f0000 e8030000 64 04 0ec6 d2110000 5a 1ac6 8c0a0000 60 2fc6 c4190000 55 41c6 30080000 63",
+    # mode 2: vị trí, không có khoảng cách
+    "02 c4090000 1b0f0000 e8030000 64 00",
+    # mode 2: đủ 15 khoảng cách
+    "02 10270000 2c010000 dc050000 5a 0f" + "".join((0xC600 + i).to_bytes(2, "little").hex()
+                                             + (1000 * (i + 1)).to_bytes(4, "little").hex() + "50"
+                                             for i in range(15)),
+)]
+
+# Word operation mode 16 bit (tag/anchor, UWB, firmware, accel, LED, initiator, low power, location engine)
+OPERATION_MODE_WORDS = [
+    "0101110001100000",
+    "1101110010100000",
+    "1101110011100000",
+    "0101100000100000",
+    "0000000000000000",
+]
+OPERATION_MODE_BYTES = [bits_to_bytes_array(word) for word in OPERATION_MODE_WORDS]
+
+COORDINATES_M = [0.0, 1.234, -12.5, 35.75, 2147.483]
+UPDATE_RATES_MS = [100, 1000, 5000, 60000, 0xFFFFFFFF]
+
+
+def _loop(func, corpus):
+    def run():
+        for item in corpus:
+            func(item)
+    return run
+
+
+BENCHMARKS = {
+    "unpack_location": (_loop(unpack_location, LOCATION_FRAMES), len(LOCATION_FRAMES)),
+    "decode_location_frame": (_loop(decode_location_frame, LOCATION_FRAMES), len(LOCATION_FRAMES)),
+    "decode_location_data": (_loop(decode_location_data, LOCATION_FRAMES), len(LOCATION_FRAMES)),
+    "decode_location_batch": (lambda: decode_location_batch(LOCATION_FRAMES), len(LOCATION_FRAMES)),
+    "encode_location_frame": (_loop(encode_location_frame, [decode_location_frame(f) for f in LOCATION_FRAMES]),
+                              len(LOCATION_FRAMES)),
+    "bit_string_to_byte_array": (_loop(bit_string_to_byte_array, OPERATION_MODE_WORDS), len(OPERATION_MODE_WORDS)),
+    "bits_to_bytes_array": (_loop(bits_to_bytes_array, OPERATION_MODE_WORDS), len(OPERATION_MODE_WORDS)),
+    "bytes_array_to_bits": (_loop(bytes_array_to_bits, OPERATION_MODE_BYTES), len(OPERATION_MODE_BYTES)),
+    "float_to_int32_bytes": (_loop(float_to_int32_bytes, COORDINATES_M), len(COORDINATES_M)),
+    "int_to_bytes_array_4_bytes": (_loop(int_to_bytes_array_4_bytes, UPDATE_RATES_MS), len(UPDATE_RATES_MS)),
+}
+
+
+def measure(run, calls, repeat, min_time=0.2):
+    """ns mỗi lần gọi: tự chọn số vòng để mỗi lần đo kéo dài ít nhất min_time giây."""
+    timer = timeit.Timer(run)
+    number, elapsed = timer.autorange()
+    number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number / calls * 1e9
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark các hàm byte trong helper.py")
+    parser.add_argument("--only", default="", help="Chỉ chạy benchmark có tên chứa chuỗi này")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả làm baseline mới")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline()
+    baseline_ns = baseline["results"] if baseline else {}
+    results = {}
+    print(f"{'benchmark':<28}{'ns/lần':>10}{'baseline':>10}{'thay đổi':>10}")
+    for name, (run, calls) in BENCHMARKS.items():
+        if args.only not in name:
+            continue
+        ns = results[name] = round(measure(run, calls, args.repeat), 1)
+        old = baseline_ns.get(name)
+        change = f"{100 * (ns - old) / old:+.1f}%" if old else "-"
+        print(f"{name:<28}{ns:>10.1f}{old if old else '-':>10}{change:>10}")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": {**baseline_ns, **results},
+            }, f, indent=2)
+            f.write("\n")
+        print(f"💾 Đã lưu baseline vào {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
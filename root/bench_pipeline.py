@@ -0,0 +1,271 @@
+"""Đo thông lượng và độ trễ end-to-end của gateway bằng transport giả lập.
+
+Luồng được đo giống hệt khi chạy thật:
+    notify (SimulatedTransport) -> enqueue_notification -> notification_queues
+    -> notification_consumer -> notification_handler -> emit_tag_data -> server giả (LoopbackServer)
+
+Mỗi frame mang số thứ tự trong toạ độ X, nên độ trễ được tính từ lúc notify đến lúc server nhận.
+
+Ví dụ:
+    python bench_pipeline.py --tags 10,100,1000 --rates 1,10 --duration 10 --output bench.json
+    python bench_pipeline.py --tags 100 --compare bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import struct
+import sys
+import time
+
+import ble_hanlder
+import server_handler
+from config import (EMIT_BATCH_ENABLE, SMOOTHING_ENABLE, MULTILAT_ENABLE, NOTIFY_CONSUMERS,
+                    RAW_PASSTHROUGH_ENABLE)
+from transport import SimulatedTransport
+from helper import decode_location_frame
+from wire import PACKED_HEADER, available_formats, decode_packed_batch, decode_raw_batch, msgpack
+
+SEQ_STRUCT = struct.Struct("<i")
+
+
+class StampedTransport(SimulatedTransport):
+    """SimulatedTransport ghi số thứ tự frame vào X (mm) và lưu thời điểm notify."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_at = {}
+        self._seq = 0
+
+    def next_frame(self, device):
+        data = super().next_frame(device)
+        if data[0] == 1:
+            return data
+        self._seq += 1
+        self.sent_at[self._seq] = time.perf_counter()
+        return data[:1] + SEQ_STRUCT.pack(self._seq) + data[5:]
+
+
+def payload_positions_x(event, data, wire_format):
+    """Toạ độ X (mm) của từng frame trong payload tag_data/tag_data_batch/tag_raw_batch theo định dạng wire."""
+    if event == "tag_raw_batch":
+        _, _, records = decode_raw_batch(data)
+        return [SEQ_STRUCT.unpack_from(r[3], 1)[0] for r in records if r[3][0] != 1]
+    batch = event == "tag_data_batch"
+    if wire_format == "json":
+        items = data["frames"] if batch else [data]
+        return [round(i["data"]["Position"]["X"] * 1000) for i in items if "Position" in i["data"]]
+    if wire_format == "msgpack":
+        items = msgpack.unpackb(data) if batch else [msgpack.unpackb(data)]
+        return [i[2][0] for i in items if i[2] is not None]
+    if batch:
+        frames = [frame for _, frame, _ in decode_packed_batch(data)]
+    else:
+        frames = [decode_location_frame(data[PACKED_HEADER.size:])]
+    return [f.position.x for f in frames if f is not None and f.position is not None]
+
+
+class LoopbackServer:
+    """Thay cho socketio.AsyncClient: nhận event ngay trong tiến trình.
+
+    Payload dict được json.dumps như khi gửi qua Socket.IO để tính cả chi phí mã hoá;
+    payload bytes (msgpack/packed) được gửi nguyên dạng nhị phân.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.connected = True
+        self.latencies = []
+        self.received = 0
+        self.bytes = 0
+        self.window = None  # (bắt đầu, kết thúc) perf_counter của khoảng đo
+
+    async def emit(self, event, data=None, **kwargs):
+        now = time.perf_counter()
+        self.bytes += len(data) if isinstance(data, (bytes, bytearray)) else len(json.dumps(data))
+        if event in ("tag_data", "tag_data_batch", "tag_raw_batch"):
+            for seq in payload_positions_x(event, data, server_handler.wire_format):
+                self._record(seq, now)
+
+    def _record(self, seq, now):
+        sent_at = self.transport.sent_at.pop(seq, None)
+        if sent_at is None or self.window is None:
+            return
+        start, end = self.window
+        if start <= sent_at <= end:
+            self.received += 1
+            self.latencies.append(now - sent_at)
+
+    async def disconnect(self):
+        self.connected = False
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def reset_pipeline():
+    for queue in ble_hanlder.notification_queues:
+        while not queue.empty():
+            queue.get_nowait()
+            queue.task_done()
+    for key in ble_hanlder.PIPELINE_STATS:
+        ble_hanlder.PIPELINE_STATS[key] = 0
+    ble_hanlder.LATEST_FRAMES.clear()
+    server_handler.outbox.pop_batch(len(server_handler.outbox))
+
+
+async def run_level(tags, rate_hz, duration, warmup, location_mode, seed, wire_format="json"):
+    transport = StampedTransport(tags, 8, rate_hz, location_mode, seed=seed)
+    server = LoopbackServer(transport)
+    ble_hanlder.transport = transport
+    server_handler.sio = server
+    server_handler.wire_format = wire_format
+    server_handler.TRACKING_ENABLE = True  # Mọi frame đi qua hàng đợi, không gộp frame
+    reset_pipeline()
+
+    consumers = ble_hanlder.start_notification_consumers()
+    tag_tasks = [asyncio.create_task(ble_hanlder.process_tag(address)) for address in transport.tag_addresses]
+    await asyncio.sleep(warmup)
+
+    generated_before = transport.notified
+    dropped_before = ble_hanlder.PIPELINE_STATS["dropped"]
+    cpu_before = cpu_seconds()
+    start = time.perf_counter()
+    server.window = (start, start + duration)
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - start
+    cpu_used = cpu_seconds() - cpu_before
+    generated = transport.notified - generated_before
+    queue_dropped = ble_hanlder.PIPELINE_STATS["dropped"] - dropped_before
+
+    for task in tag_tasks:
+        task.cancel()
+    await asyncio.gather(*tag_tasks, return_exceptions=True)
+    # Chờ các frame đã nhận trong khoảng đo đi hết pipeline
+    try:
+        await asyncio.wait_for(asyncio.gather(*(q.join() for q in ble_hanlder.notification_queues)), 10)
+    except asyncio.TimeoutError:
+        print("⚠️ Hàng đợi chưa rút hết sau 10s, độ trễ có thể bị thiếu mẫu")
+    if EMIT_BATCH_ENABLE:
+        await server_handler.tag_batcher.flush()
+    await server_handler.raw_batcher.flush()
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+
+    latencies = sorted(server.latencies)
+    to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "tags": tags,
+        "rate_hz": rate_hz,
+        "wire_format": wire_format,
+        "offered_fps": round(tags * rate_hz, 1),
+        "generated": generated,
+        "delivered": server.received,
+        "frames_per_sec": round(server.received / elapsed, 1),
+        "queue_dropped": queue_dropped,
+        "lost": max(0, generated - server.received),
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+        "max_ms": to_ms(latencies[-1] if latencies else None),
+        "cpu_percent": round(100 * cpu_used / elapsed, 1),
+        "rss_mb": round(current_rss_mb() or 0, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "emitted_kb": round(server.bytes / 1024, 1),
+    }
+
+
+def compare(results, baseline_file):
+    """In chênh lệch thông lượng và p99 so với file kết quả trước."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(r["tags"], r["rate_hz"]): r for r in json.load(f)["results"]}
+    print(f"\n📊 So sánh với {baseline_file}:")
+    for result in results:
+        old = baseline.get((result["tags"], result["rate_hz"]))
+        if old is None:
+            continue
+        fps_change = 100 * (result["frames_per_sec"] - old["frames_per_sec"]) / max(old["frames_per_sec"], 1e-9)
+        line = f"  {result['tags']:>5} tag @ {result['rate_hz']:>5} Hz: {fps_change:+.1f}% frame/s"
+        if result["p99_ms"] is not None and old["p99_ms"] is not None:
+            line += f", p99 {old['p99_ms']} -> {result['p99_ms']} ms"
+        print(line)
+
+
+async def main(args):
+    if SMOOTHING_ENABLE or MULTILAT_ENABLE:
+        print("⚠️ SMOOTHING_ENABLE/MULTILAT_ENABLE làm thay đổi toạ độ X, độ trễ sẽ không đo được")
+    results = []
+    for tags in args.tags:
+        for rate_hz in args.rates:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = await run_level(tags, rate_hz, args.duration, args.warmup, args.mode, args.seed,
+                                         args.wire)
+            results.append(result)
+            print(f"✅ {tags:>5} tag @ {rate_hz:>5} Hz: {result['frames_per_sec']:>9} frame/s "
+                  f"(yêu cầu {result['offered_fps']}), p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                  f"CPU {result['cpu_percent']}%, RSS {result['rss_mb']} MB, gửi {result['emitted_kb']} KB")
+
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "location_mode": args.mode,
+            "seed": args.seed,
+            "notify_consumers": NOTIFY_CONSUMERS,
+            "emit_batch": EMIT_BATCH_ENABLE,
+            "raw_passthrough": RAW_PASSTHROUGH_ENABLE,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Đã lưu kết quả vào {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+def parse_args(argv=None):
+    int_list = lambda s: [int(v) for v in s.split(",")]
+    float_list = lambda s: [float(v) for v in s.split(",")]
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end pipeline notify -> emit")
+    parser.add_argument("--tags", type=int_list, default=[10, 100, 500, 1000], help="Số tag, vd. 10,100,1000")
+    parser.add_argument("--rates", type=float_list, default=[10.0], help="Tần số notify mỗi tag (Hz)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Thời gian đo mỗi mức (s)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Thời gian chạy trước khi đo (s)")
+    parser.add_argument("--mode", type=int, choices=(0, 2), default=2, help="Location mode của tag ảo")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--wire", choices=available_formats(), default="json", help="Định dạng payload tag_data")
+    parser.add_argument("--label", default="", help="Nhãn phiên bản ghi vào file kết quả")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="File kết quả cũ để so sánh")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(sys.argv[1:])))
@@ -2,70 +2,416 @@ import asyncio
 
 
 import pytz
-from bleak import BleakClient, BleakScanner, BleakError
-from helper import decode_location_data
+from helper import (decode_location_frame, float_to_int32_bytes, int_to_bytes_array_4_bytes,
+                    bits_to_bytes_array, is_valid_location_frame, PositionFix)
 
-from config import OPERATION_MODE_UUID, LOCATION_DATA_MODE_UUID, LOCATION_DATA_UUID
+from config import (OPERATION_MODE_UUID, LOCATION_DATA_MODE_UUID, LOCATION_DATA_UUID, LABEL_CHAR_UUID,
+                    PERSISTED_POSITION, UPDATE_RATE_UUID,
+                    NOTIFY_QUEUE_SIZE, NOTIFY_CONSUMERS,
+                    SMOOTHING_ENABLE, SMOOTHING_TICK, SMOOTHING_PROCESS_NOISE,
+                    SMOOTHING_MEASUREMENT_NOISE, SMOOTHING_MAX_GAP,
+                    MULTILAT_ENABLE, MULTILAT_ITERATIONS, MULTILAT_TAG_HEIGHT, MODULES_FILE,
+                    RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, RECONNECT_MIN_SESSION,
+                    BLE_MAX_CONNECT_ATTEMPTS, RECENTLY_SEEN_WINDOW,
+                    PRESENCE_SCAN_ENABLE, DEVICE_NAME_PREFIXES,
+                    ADV_INGEST_ENABLE, ADV_SERVICE_DATA_UUID, ADV_MANUFACTURER_ID,
+                    ADAPTER_SHARDING_ENABLE, BLE_ADAPTERS, ADAPTER_MAX_CONNECTIONS,
+                    RAW_PASSTHROUGH_ENABLE, DEADBAND_ENABLE, DEADBAND_POSITION_DELTA, DEADBAND_RANGE_DELTA,
+                    DEADBAND_QUALITY_DELTA, DEADBAND_HEARTBEAT)
+from smoothing import TagKalmanBank, SmoothingStage
+from multilateration import Multilaterator, node_id_from_name
+from reconnect import ReconnectScheduler
+from presence import PresenceTracker
+from deadband import DeadbandFilter
+from adapters import AdapterShardManager, LinuxAdapterBackend
+from transport import get_transport
+from logger import log, frame_log
+from metrics import (registry, NOTIFY_RECEIVED, FRAMES_DECODED, FRAMES_DROPPED, MULTILAT_RESULTS,
+                     STAGE_LATENCY, CONNECT_ATTEMPTS, CONNECT_DURATION)
 import time
+import server_handler
 
 
 # Global_var
 TIMEOUT = 5
 time_zone = pytz.timezone('Asia/Ho_Chi_Minh')
-LAST_SENT_TIME = {}
 INTERVAL = 5
 DISCONNECTED_TAGS = set()
+reconnect_scheduler = ReconnectScheduler(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY,
+                                         BLE_MAX_CONNECT_ATTEMPTS, RECENTLY_SEEN_WINDOW,
+                                         min_session=RECONNECT_MIN_SESSION)
+# Backend BLE: bleak (phần cứng) hoặc giả lập (BLE_TRANSPORT = "sim")
+transport = get_transport()
+# Bảng hiện diện từ quảng bá: chỉ thử kết nối thiết bị vừa được thấy
+presence_tracker = PresenceTracker(DEVICE_NAME_PREFIXES, RECENTLY_SEEN_WINDOW, reconnect_scheduler.mark_seen,
+                                   transport)
+if PRESENCE_SCAN_ENABLE:
+    reconnect_scheduler.gate = presence_tracker.wait_present
+# Chia kết nối cho nhiều dongle BLE (hci0, hci1, ...)
+shard_manager = AdapterShardManager(LinuxAdapterBackend(), BLE_ADAPTERS, ADAPTER_MAX_CONNECTIONS)
+if ADAPTER_SHARDING_ENABLE:
+    # Scanner chạy trên từng adapter báo RSSI để assign() ưu tiên adapter nghe rõ thiết bị hơn
+    presence_tracker.on_rssi = shard_manager.report_rssi
 
-def set_operation_mode(mac_address, payload, device_type):
-    print("sdaasg")
+# Pipeline notify: mỗi tag được gán cố định vào một hàng đợi để giữ thứ tự frame
+notification_queues = [asyncio.Queue(maxsize=max(1, NOTIFY_QUEUE_SIZE // NOTIFY_CONSUMERS))
+                       for _ in range(NOTIFY_CONSUMERS)]
+PIPELINE_STATS = {"received": 0, "dropped": 0, "coalesced": 0, "processed": 0, "max_depth": 0}
+# Khi tắt tracking: mỗi tag chỉ giữ frame thô mới nhất, coalesce_loop xử lý mỗi INTERVAL giây
+LATEST_FRAMES = {}
+registry.gauge("gateway_notify_queue_depth", "Số frame đang chờ trong từng hàng đợi notify", ("queue",),
+               lambda: {(i,): queue.qsize() for i, queue in enumerate(notification_queues)})
+registry.gauge("gateway_ble_connected_tags", "Số tag đang giữ kết nối GATT", (),
+               lambda: len(session_manager.sessions))
 
-def set_location_mode(mac_address, payload, device_type):
-    print("sdaasg")
+class BleSessionManager:
+    """Giữ client BLE đang kết nối (do process_tag sở hữu) để ghi lệnh trên chính kết nối đó.
 
-def set_anchor_location(mac_address, payload, device_type):
-    print("sdaasg")
+    Khi ghi: tạm dừng notify, ghi characteristic rồi bật lại notify; các lệnh ghi cùng
+    thiết bị được tuần tự hoá bằng lock. Thiết bị không có phiên thì kết nối riêng để ghi.
+    """
 
-def set_tag_rate(mac_address, payload, device_type):
-    print("sdaasg")
+    def __init__(self):
+        self.sessions = {}
+        self.locks = {}
 
+    def register(self, address, client, notify_uuid=None, callback=None):
+        self.sessions[address] = (client, notify_uuid, callback)
 
-async def notification_handler(sender, data, address):
-    """Xử lý dữ liệu từ BLE notify, kiểm soát tần suất gửi."""
-    global LAST_SENT_TIME, INTERVAL
-    from server_handler import TRACKING_ENABLE, safe_emit
-    decoded_data = decode_location_data(data)
-    current_time = time.time()
+    def unregister(self, address, client):
+        session = self.sessions.get(address)
+        if session is not None and session[0] is client:
+            del self.sessions[address]
 
-    if TRACKING_ENABLE:
-        await safe_emit("tag_data", {"mac": address, "data": decoded_data})
-        print(f"📨 Tag {address} gửi dữ liệu!\nTracking = {TRACKING_ENABLE}\nData: {decoded_data} \n")
-    else:
-        last_sent = last_sent_time.get(address, 0)
-        if current_time - last_sent >= INTERVAL:
-            if await safe_emit("tag_data", {"mac": address, "data": decoded_data}):
-                last_sent_time[address] = current_time
-                print(
-                    f"📨 Tag [{address}] gửi dữ liệu!\nTracing = {TRACKING_ENABLE} - Delay: {INTERVAL}s\nData: {decoded_data} \n")
+    def _lock(self, address):
+        lock = self.locks.get(address)
+        if lock is None:
+            lock = self.locks[address] = asyncio.Lock()
+        return lock
 
+    async def write(self, address, char_uuid, data):
+        async with self._lock(address):
+            session = self.sessions.get(address)
+            if session is None or not session[0].is_connected:
+                return await ble_write_with_retry(address, char_uuid, data)
 
-async def process_anchor(address):
-    """Xử lý kết nối với Anchor: Chỉ kết thúc khi gửi dữ liệu thành công."""
-    from server_handler import safe_emit
-    client = BleakClient(address)
+            client, notify_uuid, callback = session
+            try:
+                if notify_uuid is not None:
+                    await client.stop_notify(notify_uuid)
+                await client.write_gatt_char(char_uuid, data, response=True)
+                print(f"✅ Ghi dữ liệu thành công vào: {address}")
+                return True
+            except Exception as e:
+                frame_log.error("Lỗi khi ghi dữ liệu vào %s: %s", address, e)
+                return False
+            finally:
+                if notify_uuid is not None and client.is_connected:
+                    try:
+                        await client.start_notify(notify_uuid, callback)
+                    except Exception as e:
+                        frame_log.error("Không thể bật lại notify cho %s: %s", address, e)
+
+
+session_manager = BleSessionManager()
+
+
+async def set_operation_mode(mac_address, payload, device_type):
+    try:
+        data_to_write = bits_to_bytes_array(payload)
+        is_succeed = await session_manager.write(mac_address, OPERATION_MODE_UUID, data_to_write)
+    except Exception as e:
+        log.error("Lỗi ghi dữ liệu set_operation_mode, %s: %s", mac_address, e)
+        return False
+    if is_succeed:
+        print(f"✅ set_operation_mode {mac_address} ({device_type}) thành công: {payload}")
+    return is_succeed
+
+async def set_location_mode(mac_address, payload, device_type):
+    try:
+        location_mode = payload.get("mode")
+        data_to_write = location_mode.to_bytes(1, byteorder='big')
+        is_succeed = await session_manager.write(mac_address, LOCATION_DATA_MODE_UUID, data_to_write)
+    except Exception as e:
+        log.error("Lỗi ghi dữ liệu set_location_mode, %s: %s", mac_address, e)
+        return False
+    if is_succeed:
+        print(f"✅ set_location_mode {mac_address} ({device_type}) thành công: location mode = {location_mode}!")
+    return is_succeed
+
+async def set_tag_rate(mac_address, payload):
+    try:
+        u1, u2 = payload.get("u1"), payload.get("u2")
+        data_to_write = int_to_bytes_array_4_bytes(u1) + int_to_bytes_array_4_bytes(u2)
+        is_succeed = await session_manager.write(mac_address, UPDATE_RATE_UUID, data_to_write)
+    except Exception as e:
+        log.error("Lỗi ghi dữ liệu set_tag_rate, %s: %s", mac_address, e)
+        return False
+    if is_succeed:
+        print(f"✅ set_tag_rate {mac_address} thành công: u1 = {u1}, u2 = {u2}!")
+    return is_succeed
+
+async def ble_write_with_retry(mac_addr, char_uuid, data_to_write, max_retries=3):
+    """Ghi khi thiết bị không có phiên đang mở (vd. anchor): kết nối tạm qua connect_client,
+    trong giới hạn số connect đồng thời và với backoff của reconnect_scheduler.
+    """
+    is_succeed = False
+    for attempt in range(max_retries):
+        await reconnect_scheduler.acquire(mac_addr)
+        try:
+            client = await connect_client(mac_addr)
+        except Exception as e:
+            frame_log.error("Lỗi kết nối %s: %s", mac_addr, e)
+            client = None
+        finally:
+            reconnect_scheduler.release()
+
+        if client is not None:
+            try:
+                await client.write_gatt_char(char_uuid, data_to_write)
+                is_succeed = True
+                print(f"✅ Ghi dữ liệu thành công vào: {mac_addr}")
+            except transport.error as ble:
+                frame_log.error("Lỗi BLE với %s: %s", mac_addr, ble)
+            except Exception as e:
+                frame_log.error("Lỗi khi ghi dữ liệu vào %s: %s", mac_addr, e)
+            finally:
+                if client.is_connected:
+                    await client.disconnect()
+                if ADAPTER_SHARDING_ENABLE:
+                    shard_manager.release(mac_addr)
+        if is_succeed:
+            break
+
+        if attempt < max_retries - 1:
+            delay = reconnect_scheduler.backoff(attempt + 1)
+            frame_log.info("Thử kết nối lại lần %s với %s sau %.1fs...", attempt + 1, mac_addr, delay,
+                           extra=RECONNECT_LOG_STYLE)
+            await asyncio.sleep(delay)
+    return is_succeed
+
+async def set_anchor_location(mac_address, payload):
+    """Ghi PERSISTED_POSITION cho anchor; thành công thì cập nhật vị trí dùng cho định vị."""
+    try:
+        x, y, z, quality_factor = payload.get("x"), payload.get("y"), payload.get("z"), payload.get("quality_factor")
+        if not isinstance(quality_factor, int) or quality_factor < 1 or quality_factor > 100:
+            raise ValueError("Quality factor phải là số nguyên từ 1 đến 100")
+        data_to_write = (float_to_int32_bytes(x) + float_to_int32_bytes(y) + float_to_int32_bytes(z)
+                         + bytearray([quality_factor]))
+        is_succeed = await session_manager.write(mac_address, PERSISTED_POSITION, data_to_write)
+    except Exception as e:
+        log.error("Lỗi ghi dữ liệu set_anchor_location, %s: %s", mac_address, e)
+        return False
+
+    if is_succeed:
+        print(f"✅ set_anchor_location {mac_address} thành công: x={x}, y={y}, z={z}, quality={quality_factor}")
+        node_id = multilaterator.node_ids_by_mac.get(mac_address)
+        if node_id is not None:
+            multilaterator.set_anchor(node_id, (x, y, z))
+    return is_succeed
+
+
+EMIT_LOG_STYLE = {"icon": "📨"}
+RECONNECT_LOG_STYLE = {"icon": "🔄"}
+
+
+deadband = DeadbandFilter(
+    DEADBAND_POSITION_DELTA, DEADBAND_RANGE_DELTA, DEADBAND_QUALITY_DELTA, DEADBAND_HEARTBEAT
+) if DEADBAND_ENABLE else None
+
+
+async def emit_frame(address, frame):
+    if deadband is not None and not deadband.should_emit(address, frame, time.monotonic()):
+        FRAMES_DROPPED.inc("deadband")
+        return
+    if await server_handler.emit_tag_data(address, frame):
+        frame_log.info("Tag %s gửi dữ liệu (tracking=%s): %s", address, server_handler.TRACKING_ENABLE, frame,
+                       extra=EMIT_LOG_STYLE)
+
+
+multilaterator = Multilaterator(MULTILAT_ITERATIONS, MULTILAT_TAG_HEIGHT)
+if MULTILAT_ENABLE:
+    multilaterator.load_modules_file(MODULES_FILE)
+
+
+def locate_frame(frame):
+    """Tính vị trí cho frame chỉ có khoảng cách; frame có vị trí được chuyển thành mode 2."""
+    position = multilaterator.solve(frame.distances)
+    if position is None:
+        MULTILAT_RESULTS.inc("unsolved")
+        return
+    MULTILAT_RESULTS.inc("solved")
+    x, y, z = (int(round(v * 1000)) for v in position)
+    frame.position = PositionFix(x, y, z, min(d.quality for d in frame.distances))
+    frame.mode = 2
+
+
+smoothing_stage = SmoothingStage(
+    TagKalmanBank(SMOOTHING_PROCESS_NOISE, SMOOTHING_MEASUREMENT_NOISE, SMOOTHING_MAX_GAP),
+    SMOOTHING_TICK, emit_frame
+) if SMOOTHING_ENABLE else None
+
+
+async def notification_handler(sender, data, address, received_at=None):
+    """Giải mã frame từ BLE notify và gửi lên server (qua bộ lọc Kalman nếu bật)."""
+    started = time.perf_counter()
+    frame = decode_location_frame(data)
+    if frame is None:
+        FRAMES_DROPPED.inc("decode_error")
+        return
+    STAGE_LATENCY.observe(time.perf_counter() - started, "decode")
+    FRAMES_DECODED.inc(frame.mode)
+    if MULTILAT_ENABLE and frame.position is None and frame.distances:
+        locate_frame(frame)
+    if smoothing_stage is not None and frame.position is not None:
+        smoothing_stage.submit(address, frame, received_at if received_at is not None else time.monotonic())
+        return
+    await emit_frame(address, frame)
+    if received_at is not None:
+        STAGE_LATENCY.observe(time.monotonic() - received_at, "end_to_end")
+
+
+def enqueue_notification(address, data):
+    """Callback BLE: chỉ đưa frame thô vào hàng đợi (không tạo task mới)."""
+    PIPELINE_STATS["received"] += 1
+    NOTIFY_RECEIVED.inc(address)
+    if RAW_PASSTHROUGH_ENABLE and not is_valid_location_frame(data):
+        FRAMES_DROPPED.inc("invalid")
+        return
+    if not server_handler.TRACKING_ENABLE:
+        # Không giải mã frame sẽ bị bỏ, chỉ ghi đè frame mới nhất của tag
+        if address in LATEST_FRAMES:
+            FRAMES_DROPPED.inc("coalesced")
+        LATEST_FRAMES[address] = (bytes(data), time.monotonic())
+        PIPELINE_STATS["coalesced"] += 1
+        return
+    if RAW_PASSTHROUGH_ENABLE:
+        # Server tự giải mã: chuyển tiếp payload thô, không qua hàng đợi giải mã
+        server_handler.raw_batcher.add(address, bytes(data), time.monotonic())
+        return
+    queue = notification_queues[hash(address) % NOTIFY_CONSUMERS]
+    try:
+        queue.put_nowait((address, bytes(data), time.monotonic()))
+    except asyncio.QueueFull:
+        PIPELINE_STATS["dropped"] += 1
+        FRAMES_DROPPED.inc("queue_full")
+        return
+    depth = queue.qsize()
+    if depth > PIPELINE_STATS["max_depth"]:
+        PIPELINE_STATS["max_depth"] = depth
+
+
+# Nhận frame location trực tiếp từ quảng bá (không giới hạn bởi số kết nối GATT)
+if ADV_INGEST_ENABLE:
+    presence_tracker.on_payload = enqueue_notification
+    presence_tracker.payload_service_uuid = ADV_SERVICE_DATA_UUID
+    presence_tracker.payload_manufacturer_id = ADV_MANUFACTURER_ID
+
+
+async def notification_consumer(queue):
+    """Giải mã, lọc và gửi tuần tự các frame của những tag thuộc hàng đợi này."""
     while True:
+        address, data, received_at = await queue.get()
+        STAGE_LATENCY.observe(time.monotonic() - received_at, "queue")
         try:
-            print(f"🔍 Đang kết nối Anchor {address}...")
-            await client.connect()
-            if not client.is_connected:
-                print(f"❌ Không thể kết nối {address}, thử lại sau {TIMEOUT} giây...")
-                await asyncio.sleep(TIMEOUT)
+            await notification_handler(None, data, address, received_at)
+        except Exception as e:
+            frame_log.error("Lỗi xử lý notify của %s: %s", address, e)
+        finally:
+            PIPELINE_STATS["processed"] += 1
+            queue.task_done()
+
+
+async def coalesce_loop():
+    """Mỗi INTERVAL giây giải mã và gửi frame mới nhất của từng tag (khi tắt tracking)."""
+    global LATEST_FRAMES
+    while True:
+        await asyncio.sleep(INTERVAL)
+        frames, LATEST_FRAMES = LATEST_FRAMES, {}
+        for address, (data, received_at) in frames.items():
+            if RAW_PASSTHROUGH_ENABLE:
+                server_handler.raw_batcher.add(address, data, received_at)
                 continue
+            try:
+                await notification_handler(None, data, address, received_at)
+            except Exception as e:
+                frame_log.error("Lỗi xử lý notify của %s: %s", address, e)
+
+
+def start_notification_consumers():
+    tasks = [asyncio.create_task(notification_consumer(queue)) for queue in notification_queues]
+    tasks.append(asyncio.create_task(coalesce_loop()))
+    if smoothing_stage is not None:
+        tasks.append(asyncio.create_task(smoothing_stage.run()))
+    return tasks
+
+
+async def connect_client(address):
+    """Một lần connect (trên adapter do shard_manager chọn nếu bật sharding).
+
+    Trả về client đã kết nối hoặc None; lỗi được in ra để scheduler tính backoff.
+    """
+    adapter = None
+    if ADAPTER_SHARDING_ENABLE:
+        adapter = shard_manager.assign(address)
+        if adapter is None:
+            frame_log.warning("Mọi adapter đều đã đầy, chưa kết nối %s", address)
+            return None
+    client = transport.client(address, adapter)
+    started = time.perf_counter()
+    result = "error"  # Lỗi khác (OSError, D-Bus, ...) vẫn được ném ra cho scheduler
+    try:
+        await client.connect()
+        if client.is_connected:
+            result = "ok"
+            return client
+        result = "failed"
+    except transport.error as e:
+        frame_log.error("Lỗi BLE %s: %s", address, e)
+    except asyncio.TimeoutError:
+        frame_log.error("Timeout khi kết nối %s", address)
+        result = "timeout"
+    finally:
+        CONNECT_ATTEMPTS.inc(result)
+        CONNECT_DURATION.observe(time.perf_counter() - started)
+        if adapter is not None and result != "ok":
+            shard_manager.release(address)
+    return None
+
+
+async def move_device(address, adapter):
+    """Ngắt thiết bị khỏi adapter quá tải; scheduler sẽ kết nối lại trên adapter khác."""
+    session = session_manager.sessions.get(address)
+    if session is not None and session[0].is_connected:
+        log.info("Chuyển %s khỏi adapter %s...", address, adapter, extra=RECONNECT_LOG_STYLE)
+        await session[0].disconnect()
+
+
+async def process_anchor(address):
+    """Xử lý kết nối với Anchor: Chỉ kết thúc khi gửi dữ liệu thành công."""
+    from server_handler import safe_emit
+    client = None
+
+    async def connect():
+        nonlocal client
+        print(f"🔍 Đang kết nối Anchor {address}...")
+        client = await connect_client(address)
+        return client is not None
 
+    async def run():
+        try:
             print(f"✅ Đã kết nối {address}, đọc dữ liệu...")
             data = await client.read_gatt_char(LOCATION_DATA_UUID)
             operation_mode_data = await client.read_gatt_char(OPERATION_MODE_UUID)
 
-            decoded_data = decode_location_data(data)
+            frame = decode_location_frame(data)
+            decoded_data = frame.to_dict() if frame is not None else None
+            if frame is not None and frame.position is not None:
+                label = await client.read_gatt_char(LABEL_CHAR_UUID)
+                node_id = node_id_from_name(bytes(label).decode("utf-8", errors="ignore"))
+                if node_id is not None:
+                    p = frame.position
+                    multilaterator.set_anchor(node_id, (p.x / 1000, p.y / 1000, p.z / 1000), address)
             operation_mode_value = int.from_bytes(operation_mode_data[:2], byteorder="big")
             operation_mode_binary = f"{operation_mode_value:016b}"
 
@@ -75,59 +421,68 @@ async def process_anchor(address):
                 "data": decoded_data,
                 "operation_mode": operation_mode_binary
             })
-            # Gửi thành công thì kết thúc vòng lặp, không quét lại
-            break
+            # Gửi thành công thì kết thúc, không quét lại
+            return True
 
-        except BleakError as e:
-            print(f"❌ Lỗi BLE {address}: {e}")
-            await asyncio.sleep(TIMEOUT)
+        except transport.error as e:
+            frame_log.error("Lỗi BLE %s: %s", address, e)
         except Exception as e:
-            print(f"❌ Lỗi không xác định với {address}: {e}")
+            frame_log.error("Lỗi không xác định với %s: %s", address, e)
         finally:
+            shard_manager.release(address)
             if client.is_connected:
                 await client.disconnect()
+        return False
+
+    await reconnect_scheduler.supervise(address, connect, run)
     print(f"✅ Hoàn thành xử lý Anchor {address}, không quét lại!")
 
 
 async def process_tag(address, max_retries=3):
-    """Xử lý kết nối với Tag và tự động kết nối lại khi mất kết nối."""
+    """Xử lý kết nối với Tag; việc kết nối lại do reconnect_scheduler điều phối."""
     global DISCONNECTED_TAGS
-    while True:
-        client = BleakClient(address)
-        for attempt in range(max_retries):
-            try:
-                await client.connect()
-                if not client.is_connected:
-                    print(f"❌ Không thể kết nối {address}, thử lần {attempt + 1}")
-                    await asyncio.sleep(TIMEOUT)
-                    continue
-
-                print(f"✅ Kết nối {address} thành công, bắt đầu nhận dữ liệu...")
-                DISCONNECTED_TAGS.discard(address)  # Đánh dấu là đã kết nối lại
-                # Nhận notify từ Tag
-                current_uuid = LOCATION_DATA_UUID
-
-                await client.start_notify(current_uuid,
-                                          lambda s, d: asyncio.create_task(notification_handler(s, d, address))
-                                          )
-
-                while client.is_connected:
-                    await asyncio.sleep(1)  # Giữ kết nối
-
-            except BleakError as e:
-                print(f"❌ Lỗi BLE {address}: {e}")
-            except asyncio.TimeoutError:
-                print(f"❌ Timeout khi kết nối {address}")
-            except Exception as e:
-                print(f"❌ Lỗi không xác định với {address}: {e}")
-            finally:
-                if client.is_connected:
-                    await client.disconnect()
+    client = None
+
+    async def connect():
+        nonlocal client
+        client = await connect_client(address)
+        if client is not None:
+            return True
+        # Sau max_retries lần thất bại liên tiếp thì đánh dấu mất kết nối
+        if reconnect_scheduler.failures.get(address, 0) + 1 >= max_retries:
+            DISCONNECTED_TAGS.add(address)
+        return False
+
+    async def run():
+        try:
+            print(f"✅ Kết nối {address} thành công, bắt đầu nhận dữ liệu...")
+            DISCONNECTED_TAGS.discard(address)  # Đánh dấu là đã kết nối lại
+            if deadband is not None:
+                deadband.forget(address)  # Frame đầu tiên sau khi kết nối lại luôn được gửi
+            # Nhận notify từ Tag
+            current_uuid = LOCATION_DATA_UUID
+
+            callback = lambda s, d: enqueue_notification(address, d)
+            await client.start_notify(current_uuid, callback)
+            # Lệnh ghi từ server dùng lại kết nối này thay vì kết nối mới
+            session_manager.register(address, client, current_uuid, callback)
+
+            while client.is_connected:
+                await asyncio.sleep(1)  # Giữ kết nối
+            frame_log.warning("Mất kết nối %s, chờ kết nối lại...", address)
+
+        except transport.error as e:
+            frame_log.error("Lỗi BLE %s: %s", address, e)
+        except Exception as e:
+            frame_log.error("Lỗi không xác định với %s: %s", address, e)
+        finally:
+            session_manager.unregister(address, client)
+            shard_manager.release(address)
+            if client.is_connected:
+                await client.disconnect()
+        return False
 
-        # Nếu thử 3 lần vẫn lỗi thì vào chế độ chờ, quét lại mỗi 10s
-        print(f"🔄 Không thể kết nối {address}, thử lại sau {TIMEOUT}s ...")
-        DISCONNECTED_TAGS.add(address)
-        await asyncio.sleep(TIMEOUT)
+    await reconnect_scheduler.supervise(address, connect, run)
 
 
 
@@ -140,7 +495,7 @@ async def process_tag(address, max_retries=3):
 #             await client.write_gatt_char(OPERATION_MODE_UUID, operation_data)
 #             print(f"Ghi du lieu operation mode thanh cong vao {address}")
 #             break
-#         except BleakError as e:
+#         except transport.error as e:
 #             attempt += 1
 #             print(f"Loi khi ghi operation mode (lan {attempt}) : {e}")
 #             if attempt <= max_retry:
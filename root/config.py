@@ -27,4 +27,108 @@ NETWORK_ID_UUID = "80f9d8bc-3bff-45bb-a181-2d6a37991208"
 LOCATION_PROXY_UUID = "f4a67d7d-379d-4183-9c03-4b6ea5103291"
 PERSISTED_POSITION = "f0f26c9b-2c8c-49ac-ab60-fe03def1b40c"
 # TAG SPECIFIC
-UPDATE_RATE_UUID = "7bd47f30-5602-4389-b069-8305731308b6"
\ No newline at end of file
+UPDATE_RATE_UUID = "7bd47f30-5602-4389-b069-8305731308b6"
+
+# SOCKET.IO EMIT
+EMIT_BATCH_ENABLE = False  # Gom tag_data thành tag_data_batch (server phải hỗ trợ event này)
+EMIT_BATCH_WINDOW_MS = 50  # Thời gian gom tối đa trước khi gửi
+EMIT_BATCH_MAX_FRAMES = 50  # Gửi ngay khi đủ số frame này
+
+# OUTBOX (giữ frame khi mất kết nối server)
+OUTBOX_POLICY = "drop_oldest"  # "drop_oldest" hoặc "keep_latest" (chỉ giữ frame mới nhất của mỗi tag)
+OUTBOX_MAX_PER_TAG = 600
+OUTBOX_MAX_FRAMES = 20000
+OUTBOX_REPLAY_BATCH = 100  # Số frame mỗi lần gửi lại
+OUTBOX_REPLAY_INTERVAL = 0.1  # Giây nghỉ giữa các lần gửi lại
+
+# SPOOL (lưu frame chưa gửi được xuống đĩa, thay cho outbox trong RAM)
+SPOOL_ENABLE = False
+SPOOL_DIR = "spool"
+SPOOL_SEGMENT_BYTES = 1024 * 1024
+SPOOL_MAX_BYTES = 256 * 1024 * 1024
+SPOOL_REPLAY_BATCH = 200
+SPOOL_FLUSH_INTERVAL = 0.5  # Giây, frame được gom trong RAM rồi ghi xuống đĩa (một lần fsync) sau khoảng này
+
+# PIPELINE XỬ LÝ NOTIFY
+NOTIFY_QUEUE_SIZE = 1024  # Tổng sức chứa hàng đợi frame thô của gateway
+NOTIFY_CONSUMERS = 4  # Số coroutine giải mã/lọc/gửi; mỗi tag luôn vào cùng một consumer
+
+# LỌC KALMAN VỊ TRÍ TAG
+SMOOTHING_ENABLE = False
+SMOOTHING_TICK = 0.05  # Giây, các frame trong một tick được lọc cùng một lô
+SMOOTHING_PROCESS_NOISE = 0.5  # Mật độ phổ gia tốc (m^2/s^3)
+SMOOTHING_MEASUREMENT_NOISE = 0.1  # Độ lệch chuẩn vị trí đo (m)
+SMOOTHING_MAX_GAP = 10.0  # Giây không có dữ liệu thì khởi tạo lại bộ lọc của tag
+
+# ĐỊNH VỊ TẠI GATEWAY TỪ KHOẢNG CÁCH (MODE 1)
+MULTILAT_ENABLE = False
+MULTILAT_ITERATIONS = 5  # Số vòng Gauss-Newton tinh chỉnh tối đa (0: chỉ dùng nghiệm tuyến tính đã cache)
+MULTILAT_TAG_HEIGHT = 1.0  # Độ cao z (m) dùng khi các anchor đồng phẳng
+MODULES_FILE = "modules.json"  # Vị trí anchor (trường "position") nếu có
+
+# BỎ FRAME KHÔNG ĐỔI (DEAD-BAND) CỦA TAG ĐỨNG YÊN
+DEADBAND_ENABLE = False
+DEADBAND_POSITION_DELTA = 50  # mm, vị trí lệch quá mức này so với frame đã gửi thì mới gửi
+DEADBAND_RANGE_DELTA = 50  # mm, tương tự cho khoảng cách đến từng anchor
+DEADBAND_QUALITY_DELTA = 10  # Quality factor đổi từ mức này trở lên thì gửi
+DEADBAND_HEARTBEAT = 30  # Giây, tag im lặng quá lâu thì vẫn gửi frame để server biết còn hoạt động
+
+# BLE
+BLE_MAX_CONNECTIONS = 5  # Số kết nối BLE đồng thời adapter hỗ trợ (giới hạn bulk_update)
+BLE_MAX_CONNECT_ATTEMPTS = 2  # Số lần connect chạy đồng thời trên adapter
+
+# KẾT NỐI LẠI TAG/ANCHOR
+RECONNECT_BASE_DELAY = 1.0  # Giây, backoff = random(0, min(MAX, BASE * 2^số lần lỗi))
+RECONNECT_MAX_DELAY = 60.0
+RECONNECT_MIN_SESSION = 10.0  # Giây, phiên ngắn hơn mức này vẫn tính là một lần thất bại (không xoá backoff)
+RECENTLY_SEEN_WINDOW = 30.0  # Giây, thiết bị thấy trong quảng bá gần đây được ưu tiên connect
+
+# QUÉT QUẢNG BÁ (PRESENCE)
+PRESENCE_SCAN_ENABLE = False  # Quét liên tục, chỉ connect thiết bị vừa quảng bá trong RECENTLY_SEEN_WINDOW
+PRESENCE_SCANNING_MODE = "passive"  # "passive" hoặc "active"
+DEVICE_NAME_PREFIXES = ("dwc", "dwd")
+
+# NHẬN VỊ TRÍ TỪ QUẢNG BÁ (không kết nối GATT)
+ADV_INGEST_ENABLE = False
+ADV_SERVICE_DATA_UUID = LOCATION_DATA_UUID  # Service data mang frame location (cùng bố cục notify)
+ADV_MANUFACTURER_ID = None  # Hoặc lấy từ manufacturer data với company ID này
+
+# NHIỀU ADAPTER BLE
+ADAPTER_SHARDING_ENABLE = False
+BLE_ADAPTERS = ["hci0", "hci1"]  # Rỗng: dùng mọi adapter đang có
+ADAPTER_MAX_CONNECTIONS = 7  # Số kết nối tối đa trên mỗi adapter
+ADAPTER_MONITOR_INTERVAL = 10  # Giây, kiểm tra adapter rút/cắm và cân bằng lại
+
+# BLE TRANSPORT
+BLE_TRANSPORT = "bleak"  # "bleak" (phần cứng thật) hoặc "sim" (giả lập để đo tải)
+SIM_TAG_COUNT = 1000
+SIM_ANCHOR_COUNT = 8
+SIM_RATE_HZ = 10  # Tần số notify mặc định của mỗi tag ảo
+SIM_LOCATION_MODE = 2  # 0: vị trí, 1: khoảng cách, 2: cả hai
+SIM_DROP_RATE = 0.0  # Xác suất mất một notify
+SIM_DISCONNECT_RATE = 0.0  # Số lần mất kết nối trung bình mỗi giây của một tag
+SIM_CONNECT_FAIL_RATE = 0.0  # Xác suất một lần connect thất bại
+SIM_ADV_INTERVAL = 1.0  # Giây giữa hai lần quảng bá
+SIM_SEED = 1
+
+# METRICS (Prometheus)
+METRICS_ENABLE = False  # Mở endpoint HTTP GET /metrics
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# LOGGING
+LOG_LEVEL = "INFO"  # Mức log chung của gateway
+LOG_FRAME_LEVEL = "INFO"  # Mức log theo từng frame (đặt "WARNING" để tắt log emit mỗi frame)
+LOG_FORMAT = "text"  # "text" hoặc "json" (mỗi dòng một object)
+LOG_FRAME_RATE = 5  # Tối đa số log/giây cho mỗi loại log theo frame (0: không giới hạn)
+LOG_FRAME_SAMPLE = 1  # Chỉ giữ 1 trong N log theo frame
+LOG_QUEUE_SIZE = 10000  # Hàng đợi log đầy thì bỏ bản ghi thay vì chặn event loop
+
+# ĐỊNH DẠNG PAYLOAD tag_data
+WIRE_FORMAT = "json"  # "json" (mặc định), "msgpack" (cần gói msgpack) hoặc "packed" (bố cục byte BLE)
+WIRE_NEGOTIATE_TIMEOUT = 5  # Giây chờ server trả lời khi thoả thuận định dạng lúc kết nối
+
+# CHUYỂN TIẾP FRAME THÔ (server tự giải mã)
+RAW_PASSTHROUGH_ENABLE = False  # Gửi payload notify chưa giải mã qua event nhị phân tag_raw_batch
+RAW_BATCH_WINDOW_MS = 50  # Thời gian gom tối đa trước khi gửi
+RAW_BATCH_MAX_FRAMES = 200  # Gửi ngay khi đủ số frame này
@@ -0,0 +1,72 @@
+import math
+
+
+class DeadbandState:
+    __slots__ = ("mode", "position", "ranges", "sent_at")
+
+    def __init__(self, mode, position, ranges, sent_at):
+        self.mode = mode
+        self.position = position
+        self.ranges = ranges
+        self.sent_at = sent_at
+
+
+class DeadbandFilter:
+    """Bỏ các frame gần như không đổi của tag đứng yên (dead-band theo từng tag).
+
+    Frame được gửi khi so với frame ĐÃ GỬI gần nhất của tag:
+    - vị trí lệch quá position_delta (mm, khoảng cách 3-D), hoặc khoảng cách đến một anchor
+      lệch quá range_delta (mm), hoặc tập anchor/mode thay đổi;
+    - quality factor (của vị trí hoặc của một anchor) đổi từ quality_delta trở lên;
+    - đã im lặng quá heartbeat giây (để server biết tag vẫn hoạt động).
+    So với frame đã gửi chứ không phải frame vừa nhận, nên tag trôi chậm vẫn được gửi khi lệch đủ xa.
+    """
+
+    def __init__(self, position_delta, range_delta, quality_delta, heartbeat):
+        self.position_delta = position_delta
+        self.range_delta = range_delta
+        self.quality_delta = quality_delta
+        self.heartbeat = heartbeat
+        self.states = {}
+        self.suppressed = 0
+
+    def _changed(self, state, frame):
+        if state.mode != frame.mode:
+            return True
+        position = frame.position
+        if (position is None) != (state.position is None):
+            return True
+        if position is not None:
+            x, y, z, quality = state.position
+            if abs(position.quality - quality) >= self.quality_delta:
+                return True
+            if math.dist((position.x, position.y, position.z), (x, y, z)) > self.position_delta:
+                return True
+        if len(frame.distances) != len(state.ranges):
+            return True
+        for d in frame.distances:
+            last = state.ranges.get(d.node_id)
+            if last is None:
+                return True
+            if abs(d.distance - last[0]) > self.range_delta or abs(d.quality - last[1]) >= self.quality_delta:
+                return True
+        return False
+
+    def should_emit(self, mac, frame, now):
+        """True nếu frame cần gửi (khi đó frame trở thành mốc so sánh mới của tag)."""
+        state = self.states.get(mac)
+        if state is not None and now - state.sent_at < self.heartbeat and not self._changed(state, frame):
+            self.suppressed += 1
+            return False
+        p = frame.position
+        self.states[mac] = DeadbandState(
+            frame.mode,
+            (p.x, p.y, p.z, p.quality) if p is not None else None,
+            {d.node_id: (d.distance, d.quality) for d in frame.distances},
+            now
+        )
+        return True
+
+    def forget(self, mac):
+        """Xoá mốc của tag (vd. khi kết nối lại) để frame kế tiếp luôn được gửi."""
+        self.states.pop(mac, None)
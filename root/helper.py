@@ -1,6 +1,9 @@
-from colorama import Fore, Style
+from colorama import Fore
+from array import array
 import struct
 
+from logger import log, frame_log
+
 
 def bit_string_to_byte_array(bit_string: str) -> bytearray:
     while len(bit_string) % 8 != 0:
@@ -13,65 +16,270 @@ def bit_string_to_byte_array(bit_string: str) -> bytearray:
 
 
 
-def decode_location_data(data):
-    try:
-        mode = data[0]
-        if mode == 0:
-            if len(data) <= 13:
-                print("Invalid Type 0 data: Expected 13 bytes")
-                return None
-            return decode_location_mode_0(data)
-        elif mode == 1:
-            return decode_location_mode_1(data)
-        elif mode == 2:
-            return decode_location_mode_2(data)
-        else:
-            print(f"Unknown location mode: {mode}")
+def bits_to_bytes_array(bit_string):
+    # Đảm bảo chuỗi bit có độ dài là bội số của 8
+    bit_string = bit_string.zfill((len(bit_string) + 7) // 8 * 8)
+
+    # Chuyển đổi sang số nguyên
+    integer_value = int(bit_string, 2)
+
+    # Chuyển thành mảng byte
+    byte_length = len(bit_string) // 8
+    return integer_value.to_bytes(byte_length, byteorder='big')
+
+
+def bytes_array_to_bits(byte_array):
+    """Ngược với bits_to_bytes_array: mảng byte -> chuỗi bit (8 bit mỗi byte)."""
+    return ''.join(bin(byte)[2:].zfill(8) for byte in byte_array)
+
+
+def int_to_bytes_array_4_bytes(value):
+    """
+    Chuyển số nguyên dương thành 4 byte (little-endian).
+    - value: Số nguyên dương (uint32_t)
+    - Trả về: bytearray 4 byte
+    """
+    if not isinstance(value, int) or value < 0 or value > 0xFFFFFFFF:
+        raise ValueError("Giá trị phải là số nguyên dương từ 0 đến 4294967295")
+
+    return bytearray([
+        value & 0xFF,
+        (value >> 8) & 0xFF,
+        (value >> 16) & 0xFF,
+        (value >> 24) & 0xFF
+    ])
+
+
+def float_to_int32_bytes(value):
+    """
+    Chuyển số thực (mét) thành 4 byte (little-endian, mm).
+    - value: Số thực (mét)
+    - Trả về: bytearray 4 byte (đơn vị mm)
+    """
+    # Chuyển mét sang mm (nhân 1000) và làm tròn thành số nguyên
+    value_mm = round(value * 1000)
+
+    # Kiểm tra phạm vi int32_t (-2147483648 đến 2147483647 mm)
+    if value_mm < -2147483648 or value_mm > 2147483647:
+        raise ValueError(f"Giá trị {value}m vượt quá phạm vi cho phép (-2147.483648m đến 2147.483647m)")
+
+    # Chuyển thành 4 byte little-endian
+    return bytearray([
+        value_mm & 0xFF,
+        (value_mm >> 8) & 0xFF,
+        (value_mm >> 16) & 0xFF,
+        (value_mm >> 24) & 0xFF
+    ])
+
+
+# Bố cục frame location (little-endian):
+#   mode 0: [mode][x:i32][y:i32][z:i32][quality:u8]
+#   mode 1: [mode][count:u8] + count * [node_id:u16][distance:i32][quality:u8]
+#   mode 2: [mode][x:i32][y:i32][z:i32][quality:u8][count:u8] + count * record
+POSITION_STRUCT = struct.Struct("<i i i B")
+DISTANCE_STRUCT = struct.Struct("<H i B")
+POSITION_END = 1 + POSITION_STRUCT.size  # 14
+
+
+def unpack_location(data):
+    """Giải mã frame location trực tiếp trên buffer gốc, không cắt mảng.
+
+    Trả về (mode, position, distances) với position = (x, y, z, quality) đơn vị mm
+    (None nếu frame không có vị trí) và distances = list (node_id, distance_mm, quality).
+    Ném ValueError nếu frame không hợp lệ.
+    """
+    buf = memoryview(data)
+    size = len(buf)
+    if size == 0:
+        raise ValueError("Empty location data")
+    mode = buf[0]
+    if mode not in (0, 1, 2):
+        raise ValueError(f"Unknown location mode: {mode}")
+
+    position = None
+    offset = 1
+    if mode != 1:
+        if size < POSITION_END:
+            raise ValueError(f"Invalid Type {mode} data: Expected {POSITION_END} bytes")
+        position = POSITION_STRUCT.unpack_from(buf, 1)
+        offset = POSITION_END
+
+    distances = []
+    if mode != 0:
+        if size <= offset:
+            raise ValueError(f"Invalid Type {mode} data: missing distances count")
+        count = buf[offset]
+        offset += 1
+        if size < offset + count * DISTANCE_STRUCT.size:
+            raise ValueError(f"Invalid Type {mode} data: Expected {count} distances")
+        unpack_from = DISTANCE_STRUCT.unpack_from
+        step = DISTANCE_STRUCT.size
+        distances = [unpack_from(buf, offset + i * step) for i in range(count)]
+    return mode, position, distances
+
+
+def is_valid_location_frame(data):
+    """Kiểm tra nhanh mode và độ dài frame như unpack_location nhưng không giải mã."""
+    size = len(data)
+    if size == 0:
+        return False
+    mode = data[0]
+    if mode == 0:
+        return size >= POSITION_END
+    if mode == 1:
+        return size >= 2 and size >= 2 + data[1] * DISTANCE_STRUCT.size
+    if mode == 2:
+        return size > POSITION_END and size >= POSITION_END + 1 + data[POSITION_END] * DISTANCE_STRUCT.size
+    return False
+
+
+class LocationBatch:
+    """Kết quả giải mã nhiều frame dưới dạng các mảng cột (array.array).
 
+    Mỗi frame hợp lệ chiếm một hàng trong các cột frame (index, mode, x, y, z,
+    quality, dist_start, dist_count); khoảng cách của frame nằm ở
+    node_id/distance/dist_quality[dist_start:dist_start + dist_count].
+    Toạ độ và khoảng cách giữ đơn vị mm, frame không có vị trí có quality = 0.
+    """
+    __slots__ = ("index", "mode", "x", "y", "z", "quality",
+                 "dist_start", "dist_count", "node_id", "distance", "dist_quality")
+
+    def __init__(self):
+        self.index = array("I")
+        self.mode = array("B")
+        self.x = array("i")
+        self.y = array("i")
+        self.z = array("i")
+        self.quality = array("B")
+        self.dist_start = array("I")
+        self.dist_count = array("B")
+        self.node_id = array("H")
+        self.distance = array("i")
+        self.dist_quality = array("B")
+
+    def __len__(self):
+        return len(self.index)
+
+
+def decode_location_batch(frames):
+    """Giải mã một list frame thô thành LocationBatch, bỏ qua các frame lỗi."""
+    batch = LocationBatch()
+    for i, data in enumerate(frames):
+        try:
+            mode, position, distances = unpack_location(data)
+        except (ValueError, struct.error):
+            continue
+        batch.index.append(i)
+        batch.mode.append(mode)
+        x, y, z, quality = position if position is not None else (0, 0, 0, 0)
+        batch.x.append(x)
+        batch.y.append(y)
+        batch.z.append(z)
+        batch.quality.append(quality)
+        batch.dist_start.append(len(batch.node_id))
+        batch.dist_count.append(len(distances))
+        for node_id, distance, dist_quality in distances:
+            batch.node_id.append(node_id)
+            batch.distance.append(distance)
+            batch.dist_quality.append(dist_quality)
+    return batch
+
+
+class PositionFix:
+    """Vị trí của một frame, toạ độ giữ nguyên đơn vị mm như trên BLE."""
+    __slots__ = ("x", "y", "z", "quality")
+
+    def __init__(self, x, y, z, quality):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.quality = quality
+
+    def __repr__(self):
+        return f"PositionFix(x={self.x}, y={self.y}, z={self.z}, quality={self.quality})"
+
+    def to_dict(self):
+        return {
+            "X": self.x / 1000,  # Chuyển từ mm sang m
+            "Y": self.y / 1000,
+            "Z": self.z / 1000,
+            "Quality Factor": self.quality
+        }
+
+
+class RangeMeasurement:
+    """Khoảng cách đến một anchor (mm)."""
+    __slots__ = ("node_id", "distance", "quality")
+
+    def __init__(self, node_id, distance, quality):
+        self.node_id = node_id
+        self.distance = distance
+        self.quality = quality
+
+    def __repr__(self):
+        return f"RangeMeasurement(node_id={self.node_id}, distance={self.distance}, quality={self.quality})"
+
+    def to_dict(self):
+        return {
+            "Node ID": self.node_id,
+            "Distance": self.distance / 1000,  # Chuyển từ mm sang m
+            "Quality Factor": self.quality
+        }
+
+
+class LocationFrame:
+    """Một frame location đã giải mã; chỉ chuyển sang dict khi gửi lên server."""
+    __slots__ = ("mode", "position", "distances")
+
+    def __init__(self, mode, position=None, distances=()):
+        self.mode = mode
+        self.position = position
+        self.distances = distances
+
+    def __repr__(self):
+        return f"LocationFrame(mode={self.mode}, position={self.position}, distances={list(self.distances)})"
+
+    def to_dict(self):
+        result = {}
+        if self.position is not None:
+            result["Position"] = self.position.to_dict()
+        if self.mode != 0:
+            result["Distances count:"] = len(self.distances)
+            result["Distances"] = [d.to_dict() for d in self.distances]
+        return result
+
+
+def decode_location_frame(data):
+    """Giải mã frame location thành LocationFrame, trả về None nếu frame lỗi."""
+    try:
+        mode, position, distances = unpack_location(data)
     except Exception as e:
-        print(f"Error decoding location: {e}")
+        frame_log.warning("Lỗi giải mã frame location: %s", e)
         return None
+    return LocationFrame(
+        mode,
+        PositionFix(*position) if position is not None else None,
+        tuple(RangeMeasurement(*d) for d in distances)
+    )
 
 
-# Position Only
-def decode_location_mode_0(data):
-    result = {}
-    # location_mode = data[0]
-    # result["Mode:"] = location_mode
-    x, y, z, quality_position = struct.unpack("<i i i B", data[1:14])
-    result["Position"] = {
-        "X": x / 1000,  # Chuyển từ mm sang m
-        "Y": y / 1000,
-        "Z": z / 1000,
-        "Quality Factor": quality_position
-    }
-    return result
-
-# Distances Only
-def decode_location_mode_1(data):
-    result = {}
-    distances = []
-    distance_count = data[0]
-    result["Distances count:"] = distance_count
-    for i in range(distance_count):
-        offset = 1 + i * 7
-        node_id, distance, quality = struct.unpack("<H i B", data[offset:offset + 7])
-        distances.append({
-            "Node ID": node_id,
-            "Distance": distance / 1000,  # Chuyển từ mm sang m
-            "Quality Factor": quality
-        })
-    result["Distances"] = distances
-    return result
+def encode_location_frame(frame):
+    """Đóng gói LocationFrame về đúng bố cục byte BLE (ngược với unpack_location)."""
+    parts = [bytes([frame.mode])]
+    if frame.mode != 1:
+        p = frame.position
+        parts.append(POSITION_STRUCT.pack(p.x, p.y, p.z, p.quality))
+    if frame.mode != 0:
+        parts.append(bytes([len(frame.distances)]))
+        pack = DISTANCE_STRUCT.pack
+        parts.extend(pack(d.node_id, d.distance, d.quality) for d in frame.distances)
+    return b"".join(parts)
+
 
-# Position + Distances)
-def decode_location_mode_2(data):
-    result = {}
-    mode_0 = decode_location_mode_0(data[:14])
-    mode_1 = decode_location_mode_1(data[14:])
-    result.update(mode_0)
-    result.update(mode_1)
-    return result
+def decode_location_data(data):
+    """Giữ định dạng dict cũ, dựa trên decode_location_frame."""
+    frame = decode_location_frame(data)
+    return frame.to_dict() if frame is not None else None
 
 
 
@@ -84,24 +292,25 @@ class MyPrint:
     RECONNECT_ICON = "🔄"
     WARNING_ICON = "⚠️"
 
+    # Ghi qua logger "gateway" (QueueHandler): không chặn event loop, tuân theo LOG_LEVEL
     @staticmethod
     def info(msg):
-        print(MyPrint.INFO_ICON + " " + Fore.LIGHTCYAN_EX + msg + Style.RESET_ALL)
+        log.info(msg, extra={"icon": MyPrint.INFO_ICON, "color": Fore.LIGHTCYAN_EX})
 
     @staticmethod
     def success(msg):
-        print(MyPrint.SUCCESS_ICON + " " + Fore.LIGHTGREEN_EX + msg + Style.RESET_ALL)
+        log.info(msg, extra={"icon": MyPrint.SUCCESS_ICON, "color": Fore.LIGHTGREEN_EX})
 
     @staticmethod
     def warning(msg):
-        print(MyPrint.WARNING_ICON + " " + Fore.YELLOW + msg + Style.RESET_ALL)
+        log.warning(msg, extra={"icon": MyPrint.WARNING_ICON, "color": Fore.YELLOW})
 
     @staticmethod
     def error(msg):
-        print(MyPrint.ERROR_ICON + " " + Fore.LIGHTRED_EX + msg + Style.RESET_ALL)
+        log.error(msg, extra={"icon": MyPrint.ERROR_ICON, "color": Fore.LIGHTRED_EX})
 
     @staticmethod
     def reconnect(msg):
-        print(MyPrint.RECONNECT_ICON + " " + Fore.LIGHTCYAN_EX + msg + Style.RESET_ALL)
+        log.info(msg, extra={"icon": MyPrint.RECONNECT_ICON, "color": Fore.LIGHTCYAN_EX})
 
 # MyPrint.reconnect("Đang xử lý tag...")
\ No newline at end of file
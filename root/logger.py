@@ -0,0 +1,190 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+from colorama import Fore, Style
+
+log = logging.getLogger("gateway")
+
+LEVEL_STYLES = {
+    logging.DEBUG: ("🐞", Fore.LIGHTBLACK_EX),
+    logging.INFO: ("ℹ️", Fore.LIGHTCYAN_EX),
+    logging.WARNING: ("⚠️", Fore.YELLOW),
+    logging.ERROR: ("❌", Fore.LIGHTRED_EX),
+    logging.CRITICAL: ("❌", Fore.LIGHTRED_EX),
+}
+
+
+class RateLimitedLogger:
+    """Bọc logging.Logger cho log lặp lại theo từng frame (notify, emit, lỗi giải mã).
+
+    Kiểm tra mức log, lấy mẫu (1 trong `sample` bản ghi) và token bucket (`rate` bản ghi/giây,
+    dồn tối đa `burst`) theo mẫu message trước khi tạo LogRecord, nên log bị bỏ gần như không tốn gì
+    và chi phí log không tăng theo số tag. Số bản ghi bị bỏ được gắn vào bản ghi kế tiếp (suppressed).
+    """
+
+    def __init__(self, logger, sample=1, rate=0.0, burst=None):
+        self.logger = logger
+        self.configure(sample, rate, burst)
+
+    def configure(self, sample=1, rate=0.0, burst=None):
+        self.sample = max(1, int(sample))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.counts = {}
+        self.buckets = {}  # msg -> [tokens, lần cập nhật, số bản ghi bị bỏ]
+
+    def _allow(self, msg):
+        """Trả về số bản ghi đã bỏ trước đó nếu được log, -1 nếu bị bỏ."""
+        if self.sample > 1:
+            count = self.counts.get(msg, 0)
+            self.counts[msg] = count + 1
+            if count % self.sample:
+                return -1
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        bucket = self.buckets.get(msg)
+        if bucket is None:
+            bucket = self.buckets[msg] = [self.burst, now, 0]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            return -1
+        bucket[0] = tokens - 1
+        suppressed, bucket[2] = bucket[2], 0
+        return suppressed
+
+    def log(self, level, msg, *args, extra=None):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._allow(msg)
+        if suppressed < 0:
+            return
+        if suppressed:
+            extra = dict(extra or (), suppressed=suppressed)
+        self.logger._log(level, msg, args, extra=extra)
+
+    def debug(self, msg, *args, extra=None):
+        self.log(logging.DEBUG, msg, *args, extra=extra)
+
+    def info(self, msg, *args, extra=None):
+        self.log(logging.INFO, msg, *args, extra=extra)
+
+    def warning(self, msg, *args, extra=None):
+        self.log(logging.WARNING, msg, *args, extra=extra)
+
+    def error(self, msg, *args, extra=None):
+        self.log(logging.ERROR, msg, *args, extra=extra)
+
+
+frame_log = RateLimitedLogger(logging.getLogger("gateway.frames"))
+
+
+class TextFormatter(logging.Formatter):
+    """Định dạng giống MyPrint (icon + màu theo mức), thêm thời gian, tên logger và các trường `fields`."""
+
+    def __init__(self, color=True):
+        super().__init__(datefmt="%H:%M:%S")
+        self.color = color
+
+    def format(self, record):
+        icon, color = LEVEL_STYLES.get(record.levelno, ("", ""))
+        icon = getattr(record, "icon", icon)
+        color = getattr(record, "color", color) if self.color else ""
+        message = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" (bỏ qua {suppressed} log tương tự)"
+        line = f"{self.formatTime(record, self.datefmt)} {record.name}: {icon} {color}{message}"
+        if self.color:
+            line += Style.RESET_ALL
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi là một dòng JSON (ts, level, logger, msg, các trường trong `fields`)."""
+
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Đưa bản ghi vào hàng đợi mà không format trên event loop; format và ghi stdout ở thread listener.
+
+    Tham số của log (args) phải không bị thay đổi sau khi log. Hàng đợi đầy thì bỏ bản ghi.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def setup_logging(level="INFO", frame_level="INFO", fmt="text", frame_rate=5.0, frame_sample=1,
+                  queue_size=10000, stream=None):
+    """Cấu hình logger "gateway": QueueHandler trên event loop, QueueListener ghi ra stream ở thread riêng.
+
+    Mức bị tắt bị chặn ngay tại isEnabledFor (không format, không vào hàng đợi).
+    Trả về QueueListener; gọi stop_logging() trước khi thoát để ghi hết log còn lại.
+    """
+    global _listener
+    stop_logging()
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+
+    for existing in list(log.handlers):
+        log.removeHandler(existing)
+    log.addHandler(DeferredQueueHandler(log_queue))
+    log.setLevel(level)
+    log.propagate = False
+
+    frame_log.logger.setLevel(frame_level)
+    frame_log.configure(frame_sample, frame_rate)
+
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,15 +1,21 @@
 import asyncio
 
-from bleak import BleakScanner
-from config import ANCHOR_MAC_LIST, TAG_MAC_LIST
-from ble_hanlder import process_anchor, process_tag
+from config import (ANCHOR_MAC_LIST, TAG_MAC_LIST, PRESENCE_SCAN_ENABLE, PRESENCE_SCANNING_MODE,
+                    ADV_INGEST_ENABLE, ADAPTER_SHARDING_ENABLE, ADAPTER_MONITOR_INTERVAL, BLE_TRANSPORT,
+                    METRICS_ENABLE, METRICS_HOST, METRICS_PORT,
+                    LOG_LEVEL, LOG_FRAME_LEVEL, LOG_FORMAT, LOG_FRAME_RATE, LOG_FRAME_SAMPLE, LOG_QUEUE_SIZE)
+from ble_hanlder import (process_anchor, process_tag, start_notification_consumers, presence_tracker,
+                         shard_manager, move_device, transport)
 from helper import MyPrint
+from metrics import registry
+from logger import setup_logging, stop_logging
 async def main():
-    from server_handler import connect_to_server, sio
+    setup_logging(LOG_LEVEL, LOG_FRAME_LEVEL, LOG_FORMAT, LOG_FRAME_RATE, LOG_FRAME_SAMPLE, LOG_QUEUE_SIZE)
+    from server_handler import connect_to_server, sio, tag_batcher, raw_batcher, spool
     await connect_to_server()
 
     # # Tìm các thiết bị BLE
-    # devices = await BleakScanner.discover(10)
+    # devices = await transport.discover(10)
     # anchors = [dev.address for dev in devices if dev.address in ANCHOR_MAC_LIST]
     # print(f"Danh sách anchor: {anchors}")
     # #
@@ -25,10 +31,35 @@ async def main():
     # # print("Đang xử lý tag...")
     # # print("Chờ server lệnh để xử lý Tag...")
     # # Khởi chạy task cho từng Tag
-    tasks = [asyncio.create_task(process_tag(tag)) for tag in TAG_MAC_LIST]
+    consumers = start_notification_consumers()
+    if METRICS_ENABLE:
+        consumers.append(asyncio.create_task(registry.serve(METRICS_HOST, METRICS_PORT)))
+    if ADAPTER_SHARDING_ENABLE:
+        consumers.append(asyncio.create_task(shard_manager.monitor(ADAPTER_MONITOR_INTERVAL, move_device)))
+    # Khi chia adapter, quét trên từng adapter để có RSSI theo adapter
+    scan_adapters = shard_manager.available if ADAPTER_SHARDING_ENABLE else None
+    if ADV_INGEST_ENABLE:
+        # Tag gửi vị trí qua quảng bá: chỉ cần scanner, không giữ kết nối GATT
+        tasks = [asyncio.create_task(presence_tracker.run(PRESENCE_SCANNING_MODE, scan_adapters))]
+    else:
+        if PRESENCE_SCAN_ENABLE:
+            consumers.append(asyncio.create_task(presence_tracker.run(PRESENCE_SCANNING_MODE, scan_adapters)))
+        if BLE_TRANSPORT == "sim":
+            # Giả lập: dùng các tag/anchor ảo thay cho danh sách MAC trong config
+            tasks = [asyncio.create_task(process_anchor(anchor)) for anchor in transport.anchor_addresses]
+            tasks += [asyncio.create_task(process_tag(tag)) for tag in transport.tag_addresses]
+        else:
+            tasks = [asyncio.create_task(process_tag(tag)) for tag in TAG_MAC_LIST]
     await asyncio.gather(*tasks)
 
+    for consumer in consumers:
+        consumer.cancel()
+    await tag_batcher.flush()
+    await raw_batcher.flush()
+    if spool is not None:
+        await spool.close()  # Ghi nốt frame còn trong bộ đệm spool
     await sio.disconnect()
+    stop_logging()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,177 @@
+import asyncio
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(labelnames, labels, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Bộ đếm chỉ tăng; nhãn truyền theo vị trí, cùng thứ tự với labelnames."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _label_text(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    """Giá trị tức thời; nếu có func thì được tính lại mỗi lần scrape (func trả về số hoặc dict nhãn -> số)."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self.func = func
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def samples(self):
+        if self.func is not None:
+            value = self.func()
+            self.values = value if isinstance(value, dict) else {(): value}
+        return super().samples()
+
+
+class Histogram:
+    """Histogram bucket cố định: observe chỉ là một bisect và vài phép cộng."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield (self.name + "_bucket",
+                       _label_text(self.labelnames, labels, f'le="{_number(bound)}"'), cumulative)
+            yield self.name + "_sum", _label_text(self.labelnames, labels), series[-1]
+            yield self.name + "_count", _label_text(self.labelnames, labels), cumulative
+
+
+class MetricsRegistry:
+    """Nơi đăng ký mọi metric trong tiến trình; render() trả về định dạng text của Prometheus."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} đã được đăng ký")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        return self.register(Gauge(name, help_text, labelnames, func))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self.register(Histogram(name, help_text, buckets, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+            except Exception as e:
+                print(f"⚠️ Lỗi đọc metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """HTTP endpoint cục bộ cho Prometheus: GET /metrics."""
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"📈 Metrics tại http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+registry = MetricsRegistry()
+
+# Pipeline notify
+NOTIFY_RECEIVED = registry.counter("gateway_notifications_received_total",
+                                   "Số notify location nhận từ BLE", ("mac",))
+FRAMES_DECODED = registry.counter("gateway_frames_decoded_total", "Số frame giải mã thành công", ("mode",))
+FRAMES_DROPPED = registry.counter("gateway_frames_dropped_total",
+                                  "Số frame bị bỏ theo lý do", ("reason",))
+MULTILAT_RESULTS = registry.counter("gateway_multilateration_total",
+                                    "Kết quả tính vị trí từ khoảng cách", ("result",))
+STAGE_LATENCY = registry.histogram("gateway_stage_latency_seconds",
+                                   "Thời gian từng bước: queue (chờ trong hàng đợi), decode, emit, "
+                                   "end_to_end (notify -> gửi xong)", labelnames=("stage",))
+
+# Socket.IO
+EMITS = registry.counter("gateway_emits_total", "Số lần emit theo event và kết quả", ("event", "result"))
+
+# BLE
+CONNECT_ATTEMPTS = registry.counter("gateway_ble_connect_attempts_total",
+                                    "Số lần kết nối BLE theo kết quả", ("result",))
+CONNECT_DURATION = registry.histogram("gateway_ble_connect_duration_seconds",
+                                      "Thời gian một lần kết nối BLE", CONNECT_BUCKETS)
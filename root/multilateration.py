@@ -0,0 +1,136 @@
+import json
+
+import numpy as np
+
+
+def node_id_from_name(name):
+    """Tên BLE của module DWM1001 là "DW" + 4 ký tự hex cuối của node ID (vd. DWC60E -> 0xC60E)."""
+    if not name or len(name) < 6 or not name.upper().startswith("DW"):
+        return None
+    try:
+        return int(name[2:6], 16)
+    except ValueError:
+        return None
+
+
+class AnchorSystem:
+    """Hệ phương trình tuyến tính hoá cho một tập anchor cố định (sắp theo node ID).
+
+    Trừ phương trình của anchor đầu tiên khỏi các phương trình còn lại:
+        2 (a_i - a_0) . p = |a_i|^2 - |a_0|^2 - (d_i^2 - d_0^2)
+    Nếu các anchor đồng phẳng (hạng < 3) thì chỉ giải x, y và cố định z.
+    Giả nghịch đảo của A (qua QR) được tính sẵn, mỗi frame chỉ còn một phép nhân ma trận-vector.
+    """
+
+    def __init__(self, node_ids, coords, fixed_z):
+        self.node_ids = node_ids
+        self.coords = coords
+        A = 2 * (coords[1:] - coords[0])
+        self.planar = np.linalg.matrix_rank(A, tol=1e-3) < 3
+        self.fixed_z = fixed_z
+        norms = np.einsum("ij,ij->i", coords, coords)
+        self.b_const = norms[1:] - norms[0]
+        if self.planar:
+            # Chuyển phần z cố định sang vế phải
+            self.b_const = self.b_const - A[:, 2] * fixed_z
+            A = A[:, :2]
+        self.A = A
+        # A = QR  =>  A^+ = R^-1 Q^T
+        q, r = np.linalg.qr(A)
+        if abs(np.linalg.det(r)) > 1e-9:
+            self.pinv = np.linalg.solve(r, q.T)
+        else:
+            self.pinv = np.linalg.pinv(A)
+
+    def linear_solve(self, distances):
+        d2 = distances ** 2
+        b = self.b_const - (d2[1:] - d2[0])
+        solution = self.pinv @ b
+        if self.planar:
+            return np.array([solution[0], solution[1], self.fixed_z])
+        return solution
+
+
+class Multilaterator:
+    """Tính vị trí tag từ khoảng cách đến các anchor đã biết vị trí (mode 1).
+
+    Nghiệm tuyến tính dùng giả nghịch đảo đã cache cho từng tập anchor; nếu iterations > 0
+    thì tinh chỉnh thêm bằng Gauss-Newton có trọng số (trọng số = quality factor).
+    Cache chỉ bị xoá khi vị trí một anchor thay đổi (set_anchor với toạ độ mới hoặc invalidate).
+    """
+
+    def __init__(self, iterations=5, fixed_z=0.0):
+        self.iterations = iterations
+        self.fixed_z = fixed_z
+        self.anchors = {}
+        self.node_ids_by_mac = {}
+        self._systems = {}
+
+    def set_anchor(self, node_id, position, mac=None):
+        if mac is not None:
+            self.node_ids_by_mac[mac] = node_id
+        position = np.asarray(position, dtype=float)
+        old = self.anchors.get(node_id)
+        if old is not None and np.allclose(old, position):
+            return
+        self.anchors[node_id] = position
+        self.invalidate(node_id)
+
+    def invalidate(self, node_id):
+        """Xoá các hệ đã cache có chứa anchor node_id."""
+        self._systems = {ids: system for ids, system in self._systems.items() if node_id not in ids}
+
+    def load_modules_file(self, file_path):
+        """Nạp vị trí anchor từ modules.json (trường "position": {"x", "y", "z"}, đơn vị m)."""
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                modules = json.load(f)
+        except Exception as e:
+            print(f"Lỗi khi đọc file JSON: {e}")
+            return 0
+        count = 0
+        for module in modules:
+            position = module.get("position")
+            node_id = node_id_from_name(module.get("name"))
+            if module.get("type") != "anchor" or not position or node_id is None:
+                continue
+            self.set_anchor(node_id, (position["x"], position["y"], position["z"]), module.get("id"))
+            count += 1
+        return count
+
+    def system_for(self, node_ids):
+        system = self._systems.get(node_ids)
+        if system is None:
+            coords = np.array([self.anchors[n] for n in node_ids])
+            system = self._systems[node_ids] = AnchorSystem(node_ids, coords, self.fixed_z)
+        return system
+
+    def solve(self, distances):
+        """distances: các RangeMeasurement của frame. Trả về (x, y, z) mét hoặc None."""
+        known = sorted((d.node_id, d.distance / 1000, d.quality) for d in distances
+                       if d.node_id in self.anchors)
+        if len(known) < 3:
+            return None
+        node_ids = tuple(n for n, _, _ in known)
+        system = self.system_for(node_ids)
+        if not system.planar and len(known) < 4:
+            return None
+        ranges = np.array([d for _, d, _ in known])
+        weights = np.array([max(q, 1) for _, _, q in known], dtype=float)
+
+        p = system.linear_solve(ranges)
+        free = 2 if system.planar else 3
+        for _ in range(self.iterations):
+            diff = p - system.coords
+            predicted = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            predicted = np.maximum(predicted, 1e-6)
+            J = (diff / predicted[:, None])[:, :free]
+            residual = predicted - ranges
+            JtW = J.T * weights
+            step = np.linalg.lstsq(JtW @ J, -JtW @ residual, rcond=None)[0]
+            p[:free] += step
+            if np.abs(step).max() < 1e-4:
+                break
+        if not np.all(np.isfinite(p)):
+            return None
+        return p
@@ -0,0 +1,80 @@
+from collections import deque
+
+DROP_OLDEST = "drop_oldest"
+KEEP_LATEST = "keep_latest"
+
+
+class TagOutbox:
+    """Hàng đợi vòng theo từng tag cho các frame chưa gửi được lên server.
+
+    - drop_oldest: mỗi tag giữ tối đa max_per_tag frame, đầy thì bỏ frame cũ nhất.
+    - keep_latest: mỗi tag chỉ giữ frame mới nhất.
+    Tổng số frame không vượt quá max_total; khi vượt sẽ bỏ frame cũ nhất của tag
+    đang chiếm nhiều chỗ nhất.
+    """
+
+    def __init__(self, max_per_tag, max_total, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, KEEP_LATEST):
+            raise ValueError(f"Overflow policy không hợp lệ: {policy}")
+        self.max_per_tag = 1 if policy == KEEP_LATEST else max_per_tag
+        self.max_total = max_total
+        self.policy = policy
+        self.queues = {}
+        self.total = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.total
+
+    def push(self, mac, frame):
+        queue = self.queues.get(mac)
+        if queue is None:
+            queue = self.queues[mac] = deque()
+        if len(queue) >= self.max_per_tag:
+            queue.popleft()
+            self.total -= 1
+            self.dropped += 1
+        queue.append(frame)
+        self.total += 1
+        if self.total > self.max_total:
+            self._evict()
+
+    def extend(self, items):
+        for mac, frame in items:
+            self.push(mac, frame)
+
+    def _evict(self):
+        mac = max(self.queues, key=lambda m: len(self.queues[m]))
+        self.queues[mac].popleft()
+        self.total -= 1
+        self.dropped += 1
+
+    def pop_batch(self, size):
+        """Lấy tối đa size frame, xoay vòng giữa các tag, giữ thứ tự trong từng tag."""
+        batch = []
+        while self.total and len(batch) < size:
+            for mac in list(self.queues):
+                queue = self.queues[mac]
+                batch.append((mac, queue.popleft()))
+                self.total -= 1
+                if not queue:
+                    del self.queues[mac]
+                if len(batch) >= size:
+                    break
+        return batch
+
+    def requeue(self, batch):
+        """Trả lô chưa gửi được về đầu hàng đợi (giữ thứ tự ban đầu)."""
+        for mac, frame in reversed(batch):
+            queue = self.queues.get(mac)
+            if queue is None:
+                queue = self.queues[mac] = deque()
+            queue.appendleft(frame)
+            self.total += 1
+        for mac, queue in self.queues.items():
+            while len(queue) > self.max_per_tag:
+                queue.popleft()
+                self.total -= 1
+                self.dropped += 1
+        while self.total > self.max_total:
+            self._evict()
@@ -0,0 +1,169 @@
+import asyncio
+import functools
+import itertools
+import time
+
+try:
+    from bleak.assigned_numbers import AdvertisementDataType
+    from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
+except ImportError:  # Không phải BlueZ hoặc bleak cũ: chỉ quét chủ động
+    OrPattern = None
+
+
+def case_variants(prefix):
+    """Mọi cách viết hoa/thường của prefix (bộ lọc or_patterns của BlueZ so khớp byte chính xác)."""
+    return ["".join(chars) for chars in itertools.product(*({c.lower(), c.upper()} for c in prefix))]
+
+
+def extract_location_payload(advertisement_data, service_uuid=None, manufacturer_id=None):
+    """Lấy frame location (cùng bố cục với LOCATION_DATA_UUID) từ manufacturer/service data."""
+    if manufacturer_id is not None:
+        payload = advertisement_data.manufacturer_data.get(manufacturer_id)
+        if payload:
+            return payload
+    if service_uuid is not None:
+        return advertisement_data.service_data.get(service_uuid)
+    return None
+
+
+class PresenceEntry:
+    __slots__ = ("last_seen", "rssi", "name")
+
+    def __init__(self, last_seen, rssi, name):
+        self.last_seen = last_seen
+        self.rssi = rssi
+        self.name = name
+
+
+class PresenceTracker:
+    """Quét BLE liên tục, lưu bảng MAC -> (lần thấy cuối, RSSI, tên) cho các module DW*.
+
+    Bảng được đánh chỉ mục theo tiền tố tên (dwc/dwd). wait_present() cho phép logic
+    kết nối lại chỉ thử các thiết bị vừa quảng bá trong `window` giây.
+    Nếu đặt on_payload, frame location trong quảng bá được chuyển cho on_payload(mac, data)
+    (bỏ qua quảng bá lặp lại cùng nội dung), không cần kết nối GATT.
+    run(adapters=[...]) quét trên từng adapter; khi đó on_rssi(mac, adapter, rssi) nhận RSSI
+    theo từng adapter (dùng cho AdapterShardManager.report_rssi).
+    """
+
+    def __init__(self, prefixes, window, on_seen=None, transport=None):
+        if transport is None:
+            from transport import BleakTransport
+            transport = BleakTransport()
+        self.transport = transport
+        self.prefixes = tuple(p.lower() for p in prefixes)
+        self.window = window
+        self.on_seen = on_seen
+        self.devices = {}
+        self.by_prefix = {prefix: set() for prefix in self.prefixes}
+        self.running = False
+        self._events = {}
+        self.on_payload = None
+        self.on_rssi = None
+        self.payload_service_uuid = None
+        self.payload_manufacturer_id = None
+        self._last_payload = {}
+
+    def _prefix_of(self, name):
+        lower = name.lower()
+        for prefix in self.prefixes:
+            if lower.startswith(prefix):
+                return prefix
+        return None
+
+    def update(self, address, name, rssi, when=None):
+        prefix = self._prefix_of(name) if name else None
+        if prefix is None:
+            return False
+        when = time.monotonic() if when is None else when
+        entry = self.devices.get(address)
+        if entry is None:
+            self.devices[address] = PresenceEntry(when, rssi, name)
+            self.by_prefix[prefix].add(address)
+        else:
+            entry.last_seen, entry.rssi, entry.name = when, rssi, name
+        event = self._events.get(address)
+        if event is not None:
+            event.set()
+        if self.on_seen is not None:
+            self.on_seen(address, when)
+        return True
+
+    def is_present(self, address):
+        entry = self.devices.get(address)
+        return entry is not None and time.monotonic() - entry.last_seen <= self.window
+
+    def present(self, prefix=None):
+        addresses = self.by_prefix.get(prefix.lower(), ()) if prefix else self.devices
+        now = time.monotonic()
+        return [a for a in addresses if now - self.devices[a].last_seen <= self.window]
+
+    async def wait_present(self, address):
+        """Chờ đến khi thiết bị quảng bá (không chờ nếu scanner không chạy)."""
+        if not self.running or self.is_present(address):
+            return
+        event = self._events.setdefault(address, asyncio.Event())
+        event.clear()
+        await event.wait()
+
+    def _on_detect(self, device, advertisement_data, adapter=None):
+        name = advertisement_data.local_name or device.name
+        if not self.update(device.address, name, advertisement_data.rssi):
+            return
+        if adapter is not None and self.on_rssi is not None:
+            self.on_rssi(device.address, adapter, advertisement_data.rssi)
+        if self.on_payload is None:
+            return
+        payload = extract_location_payload(advertisement_data, self.payload_service_uuid,
+                                           self.payload_manufacturer_id)
+        if payload and self._last_payload.get(device.address) != payload:
+            self._last_payload[device.address] = payload
+            self.on_payload(device.address, payload)
+
+    def _scanner(self, scanning_mode, adapter=None):
+        kwargs = {"detection_callback": self._on_detect, "scanning_mode": scanning_mode}
+        if adapter is not None:
+            kwargs["detection_callback"] = functools.partial(self._on_detect, adapter=adapter)
+            kwargs["adapter"] = adapter
+        if scanning_mode == "passive" and OrPattern is not None:
+            # BlueZ chỉ cho quét thụ động khi có bộ lọc: lọc theo tiền tố tên thiết bị,
+            # thêm mọi biến thể hoa/thường để khớp không phân biệt hoa thường như _prefix_of()
+            kwargs["bluez"] = {"or_patterns": [
+                OrPattern(0, AdvertisementDataType.COMPLETE_LOCAL_NAME, variant.encode())
+                for prefix in self.prefixes for variant in sorted(case_variants(prefix))
+            ]}
+        return self.transport.scanner(**kwargs)
+
+    async def _start(self, scanning_mode, adapter=None):
+        try:
+            scanner = self._scanner(scanning_mode, adapter)
+            await scanner.start()
+        except Exception as e:
+            print(f"⚠️ Không quét {scanning_mode} được ({e}), chuyển sang quét chủ động...")
+            scanner = self._scanner("active", adapter)
+            await scanner.start()
+        return scanner
+
+    async def run(self, scanning_mode="passive", adapters=None):
+        scanners = []
+        for adapter in adapters or (None,):
+            try:
+                scanners.append(await self._start(scanning_mode, adapter))
+            except Exception as e:
+                if not adapters or len(adapters) == 1:
+                    raise
+                print(f"⚠️ Không quét được trên {adapter}: {e}")
+        if not scanners:
+            raise RuntimeError("Không quét được trên adapter nào")
+
+        self.running = True
+        print(f"🔍 Đang quét quảng bá BLE liên tục ({scanning_mode}, {len(scanners)} scanner)...")
+        try:
+            while True:
+                await asyncio.sleep(1)
+        finally:
+            self.running = False
+            for event in self._events.values():
+                event.set()
+            for scanner in scanners:
+                await scanner.stop()
@@ -0,0 +1,101 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class ReconnectScheduler:
+    """Điều phối kết nối lại cho mọi tag/anchor thay cho các vòng while True riêng lẻ.
+
+    - Mỗi thiết bị có backoff luỹ thừa với full jitter: chờ random(0, min(max_delay, base * 2^n))
+      sau n lần thất bại liên tiếp.
+    - Tối đa max_concurrent lần connect chạy cùng lúc trên adapter.
+    - Khi phải xếp hàng, thiết bị vừa thấy trong quảng bá (trong recent_window giây) được ưu tiên.
+    - Số lần thất bại chỉ được xoá khi phiên giữ được ít nhất min_session giây; kết nối được rồi
+      rớt ngay cũng tính là thất bại, tránh thiết bị chập chờn kết nối lại liên tục không backoff.
+    - gate (tuỳ chọn): coroutine gate(address) chờ đến khi được phép thử kết nối thiết bị.
+    """
+
+    def __init__(self, base_delay, max_delay, max_concurrent, recent_window, gate=None, min_session=10.0):
+        self.gate = gate
+        self.min_session = min_session
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrent = max_concurrent
+        self.recent_window = recent_window
+        self.failures = {}
+        self.last_seen = {}
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def mark_seen(self, address, when=None):
+        self.last_seen[address] = time.monotonic() if when is None else when
+
+    def seen_recently(self, address):
+        last_seen = self.last_seen.get(address)
+        return last_seen is not None and time.monotonic() - last_seen <= self.recent_window
+
+    def backoff(self, failures):
+        """Thời gian chờ (full jitter) sau `failures` lần thất bại liên tiếp."""
+        if failures == 0:
+            return 0
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** failures))
+
+    def next_delay(self, address):
+        return self.backoff(self.failures.get(address, 0))
+
+    async def acquire(self, address):
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        priority = 0 if self.seen_recently(address) else 1
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Đã được nhường slot nhưng bị huỷ
+            raise
+
+    def release(self):
+        # Nhường slot trực tiếp cho thiết bị ưu tiên nhất đang chờ
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def supervise(self, address, connect, run):
+        """Vòng đời một thiết bị: connect() trả về True nếu kết nối được,
+        run() giữ phiên đến khi mất kết nối; run() trả về True thì dừng hẳn.
+        """
+        while True:
+            delay = self.next_delay(address)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.gate is not None:
+                await self.gate(address)
+
+            await self.acquire(address)
+            try:
+                is_connected = await connect()
+            except Exception as e:
+                print(f"❌ Lỗi kết nối {address}: {e}")
+                is_connected = False
+            finally:
+                self.release()
+
+            if not is_connected:
+                self.failures[address] = self.failures.get(address, 0) + 1
+                continue
+            started = time.monotonic()
+            if await run():
+                return
+            if time.monotonic() - started >= self.min_session:
+                self.failures[address] = 0
+            else:
+                self.failures[address] = self.failures.get(address, 0) + 1
@@ -1,18 +1,215 @@
 import socketio
 import asyncio
-from config import SERVER_URL, TAG_MAC_LIST, ANCHOR_MAC_LIST
+import time
+from config import (SERVER_URL, TAG_MAC_LIST, ANCHOR_MAC_LIST,
+                    EMIT_BATCH_ENABLE, EMIT_BATCH_WINDOW_MS, EMIT_BATCH_MAX_FRAMES,
+                    OUTBOX_POLICY, OUTBOX_MAX_PER_TAG, OUTBOX_MAX_FRAMES,
+                    OUTBOX_REPLAY_BATCH, OUTBOX_REPLAY_INTERVAL,
+                    SPOOL_ENABLE, SPOOL_DIR, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES, SPOOL_REPLAY_BATCH,
+                    SPOOL_FLUSH_INTERVAL,
+                    BLE_MAX_CONNECTIONS, WIRE_FORMAT, WIRE_NEGOTIATE_TIMEOUT,
+                    RAW_BATCH_WINDOW_MS, RAW_BATCH_MAX_FRAMES)
+from helper import decode_location_frame, encode_location_frame
+from outbox import TagOutbox
+from spool import FrameSpool
+from metrics import registry, EMITS, STAGE_LATENCY
+from logger import log, frame_log
+from wire import available_formats, encode_tag_data, encode_tag_batch, encode_raw_batch
 
 
 sio = socketio.AsyncClient()
 TIMEOUT = 5
 TRACKING_ENABLE = False
 command_queue = asyncio.Queue()
+# Dùng chung cho mọi bulk_update: các lô chồng nhau vẫn không vượt BLE_MAX_CONNECTIONS thao tác BLE
+bulk_semaphore = asyncio.Semaphore(BLE_MAX_CONNECTIONS)
+outbox = TagOutbox(OUTBOX_MAX_PER_TAG, OUTBOX_MAX_FRAMES, OUTBOX_POLICY)
+spool = FrameSpool(SPOOL_DIR, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES, SPOOL_FLUSH_INTERVAL) if SPOOL_ENABLE else None
+_draining = False
+_drain_timer = None
+wire_format = "json"  # Định dạng payload tag_data đã thoả thuận với server (xem wire.py)
+registry.gauge("gateway_command_queue_depth", "Số lệnh đang chờ trong command_queue", (), command_queue.qsize)
+registry.gauge("gateway_outbox_frames", "Số frame đang giữ trong outbox", (), lambda: len(outbox))
+registry.gauge("gateway_outbox_dropped_frames", "Số frame outbox đã bỏ do đầy", (), lambda: outbox.dropped)
 
-async def safe_emit(event, data):
+async def safe_emit(event, data) -> bool:
     if sio.connected:
-        await sio.emit(event, data)
+        started = time.perf_counter()
+        try:
+            await sio.emit(event, data)
+        except Exception:
+            EMITS.inc(event, "error")
+            raise
+        STAGE_LATENCY.observe(time.perf_counter() - started, "emit")
+        EMITS.inc(event, "ok")
+        return True
     else:
-        print(f"❌ Không thể gửi '{event}' vì không kết nối với server!")
+        EMITS.inc(event, "disconnected")
+        frame_log.warning("Không thể gửi '%s' vì không kết nối với server!", event)
+        return False
+
+def has_backlog() -> bool:
+    return len(outbox) > 0 or (spool is not None and spool.pending)
+
+def defer_frames(frames):
+    """Giữ lại các frame chưa gửi được: ghi xuống spool nếu bật, ngược lại vào outbox."""
+    if spool is None:
+        outbox.extend(frames)
+        return
+    now = time.time()
+    for mac, frame in frames:
+        spool.append(mac, encode_location_frame(frame), now)
+
+
+class EmitBatcher:
+    """Gom frame của mọi tag trong tối đa window_ms hoặc max_frames rồi gửi một event.
+
+    Frame được giữ theo thứ tự nhận nên thứ tự của từng tag không đổi;
+    lock đảm bảo các lô được gửi tuần tự.
+    """
+
+    def __init__(self, event, window_ms, max_frames):
+        self.event = event
+        self.window = window_ms / 1000
+        self.max_frames = max_frames
+        self._frames = []
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    async def add(self, mac, frame) -> bool:
+        self._frames.append((mac, frame))
+        if len(self._frames) >= self.max_frames:
+            return await self.flush()
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+        return True
+
+    def _on_timer(self):
+        self._timer = None
+        asyncio.create_task(self.flush())
+
+    async def spill(self):
+        """Chuyển frame đang gom sang outbox/spool (sau khi lô đang gửi dở xong).
+
+        Gọi trước khi hoãn một frame mới để frame cũ hơn luôn đứng trước trong outbox/spool.
+        """
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            frames, self._frames = self._frames, []
+            if frames:
+                defer_frames(frames)
+
+    async def flush(self) -> bool:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            frames, self._frames = self._frames, []
+            if not frames:
+                return True
+            try:
+                sent = await safe_emit(self.event, encode_tag_batch(wire_format, frames))
+            except Exception as e:
+                frame_log.error("Lỗi gửi '%s': %s", self.event, e)
+                defer_frames(frames)
+                schedule_drain()
+                return True
+            if not sent:
+                defer_frames(frames)
+            return True
+
+
+tag_batcher = EmitBatcher("tag_data_batch", EMIT_BATCH_WINDOW_MS, EMIT_BATCH_MAX_FRAMES)
+
+
+class RawFrameBatcher:
+    """Chế độ chuyển tiếp thô: gom payload notify chưa giải mã rồi gửi một event nhị phân.
+
+    Mỗi frame được gắn MAC, số thứ tự riêng của tag (u32, để server phát hiện mất frame)
+    và thời điểm nhận monotonic; bố cục lô xem wire.encode_raw_batch.
+    Lô không gửi được thì mới giải mã để đưa vào outbox/spool như frame thường.
+    """
+
+    def __init__(self, event, window_ms, max_frames):
+        self.event = event
+        self.window = window_ms / 1000
+        self.max_frames = max_frames
+        self._records = []
+        self._seq = {}
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, mac, data, received_at):
+        """Gọi trực tiếp từ callback BLE (không await)."""
+        seq = self._seq.get(mac, 0)
+        self._seq[mac] = (seq + 1) & 0xFFFFFFFF
+        self._records.append((mac, seq, received_at, data))
+        if len(self._records) >= self.max_frames:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = asyncio.get_running_loop().call_soon(self._on_timer)
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        asyncio.create_task(self.flush())
+
+    async def flush(self) -> bool:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            records, self._records = self._records, []
+            if not records:
+                return True
+            if sio.connected and not has_backlog():
+                payload = encode_raw_batch(records, time.time(), time.monotonic())
+                try:
+                    if await safe_emit(self.event, payload):
+                        return True
+                except Exception as e:
+                    frame_log.error("Lỗi gửi '%s': %s", self.event, e)
+                    schedule_drain()
+            frames = []
+            for mac, _, _, data in records:
+                frame = decode_location_frame(data)
+                if frame is not None:
+                    frames.append((mac, frame))
+            defer_frames(frames)
+            return False
+
+
+raw_batcher = RawFrameBatcher("tag_raw_batch", RAW_BATCH_WINDOW_MS, RAW_BATCH_MAX_FRAMES)
+
+async def emit_tag_data(mac, frame) -> bool:
+    """Gửi LocationFrame của tag, chỉ chuyển sang dict JSON tại đây.
+
+    Khi mất kết nối (hoặc outbox còn frame chờ gửi lại) frame được đưa vào outbox
+    để giữ thứ tự; trả về True nghĩa là frame đã được nhận để gửi.
+    """
+    if not sio.connected or has_backlog():
+        if EMIT_BATCH_ENABLE:
+            await tag_batcher.spill()  # Frame còn trong lô là frame cũ hơn, phải vào outbox trước
+        defer_frames([(mac, frame)])
+        return True
+    if EMIT_BATCH_ENABLE:
+        return await tag_batcher.add(mac, frame)
+    try:
+        return await safe_emit("tag_data", encode_tag_data(wire_format, mac, frame))
+    except Exception as e:
+        frame_log.error("Lỗi gửi 'tag_data': %s", e)
+        defer_frames([(mac, frame)])
+        schedule_drain()
+        return True
 
 async def connect_to_server(max_retries=3):
     """Kết nối đến server với khả năng tự động thử lại."""
@@ -34,7 +231,7 @@ async def connect_to_server(max_retries=3):
                 return  # Dừng vòng lặp nếu kết nối thành công
 
         except Exception as e:
-            print(f"❌ Lỗi kết nối server: {e}")
+            log.error("Lỗi kết nối server: %s", e)
             await asyncio.sleep(TIMEOUT)  # Chờ trước khi thử lại
 
     while True:
@@ -42,7 +239,7 @@ async def connect_to_server(max_retries=3):
             print("✅ Server đã kết nối, không cần thử lại!")
             return
         try:
-            print(f"🔄 Server vẫn chưa kết nối được, thử lại sau {TIMEOUT} giây...")
+            log.warning("Server vẫn chưa kết nối được, thử lại sau %s giây...", TIMEOUT)
             await asyncio.sleep(TIMEOUT)
             await sio.connect(SERVER_URL)
 
@@ -51,7 +248,120 @@ async def connect_to_server(max_retries=3):
                 return
 
         except Exception as e:
-            print(f"❌ Lỗi kết nối server: {e}")
+            log.error("Lỗi kết nối server: %s", e)
+
+async def replay_frames(frames) -> int:
+    """Gửi lại các (mac, frame[, time]) theo cùng event như khi gửi trực tiếp
+    (tag_data_batch nếu bật EMIT_BATCH_ENABLE, ngược lại từng tag_data).
+
+    Trả về số frame đầu danh sách đã gửi được; lỗi khi emit được coi như chưa gửi.
+    """
+    if EMIT_BATCH_ENABLE:
+        try:
+            sent = await safe_emit("tag_data_batch", encode_tag_batch(wire_format, frames))
+        except Exception as e:
+            frame_log.error("Lỗi gửi lại 'tag_data_batch': %s", e)
+            return 0
+        return len(frames) if sent else 0
+    for count, item in enumerate(frames):
+        try:
+            sent = await safe_emit("tag_data", encode_tag_data(wire_format, item[0], item[1]))
+        except Exception as e:
+            frame_log.error("Lỗi gửi lại 'tag_data': %s", e)
+            return count
+        if not sent:
+            return count
+    return len(frames)
+
+def schedule_drain(delay=OUTBOX_REPLAY_INTERVAL):
+    """Hẹn chạy lại drain_outbox khi còn kết nối (vd. emit lỗi mà không mất kết nối)."""
+    global _drain_timer
+    if _drain_timer is not None or not sio.connected:
+        return
+
+    def start():
+        global _drain_timer
+        _drain_timer = None
+        if sio.connected and has_backlog():
+            asyncio.create_task(drain_outbox())
+
+    _drain_timer = asyncio.get_running_loop().call_later(delay, start)
+
+async def drain_outbox():
+    """Gửi lại các frame trong outbox theo lô, giới hạn tốc độ sau khi kết nối lại."""
+    global _draining
+    if _draining:
+        return
+    _draining = True
+    try:
+        if spool is not None and not await replay_spool():
+            return
+        while len(outbox) and sio.connected:
+            batch = outbox.pop_batch(OUTBOX_REPLAY_BATCH)
+            sent = await replay_frames(batch)
+            if sent < len(batch):
+                outbox.requeue(batch[sent:])
+                schedule_drain()
+                return
+            await asyncio.sleep(OUTBOX_REPLAY_INTERVAL)
+        if outbox.dropped:
+            frame_log.warning("Outbox đã bỏ %s frame do vượt giới hạn bộ nhớ!", outbox.dropped)
+            outbox.dropped = 0
+    finally:
+        _draining = False
+
+async def replay_spool() -> bool:
+    """Gửi lại tuần tự các bản ghi trong spool, trả về True khi spool đã rỗng."""
+    while spool.pending and sio.connected:
+        records, position = await spool.read_batch(SPOOL_REPLAY_BATCH)
+        if position is None:
+            break
+        frames = []
+        ends = []
+        for mac, timestamp, data, end in records:
+            frame = decode_location_frame(data)
+            if frame is not None:
+                frames.append((mac, frame, timestamp))
+                ends.append(end)
+        sent = await replay_frames(frames)
+        if sent < len(frames):
+            if sent:
+                await spool.commit(ends[sent - 1])
+            schedule_drain()
+            return False
+        await spool.commit(position)
+        await asyncio.sleep(OUTBOX_REPLAY_INTERVAL)
+    return not spool.pending
+
+async def negotiate_wire_format():
+    """Đề xuất WIRE_FORMAT với server qua event "wire_format"; server trả về định dạng chọn
+    (chuỗi hoặc {"format": ...}). Không trả lời hoặc không hỗ trợ thì giữ JSON.
+    """
+    global wire_format
+    wire_format = "json"
+    if WIRE_FORMAT == "json":
+        return
+    offered = [f for f in (WIRE_FORMAT, "json") if f in available_formats()]
+    try:
+        reply = await sio.call("wire_format", {"formats": offered}, timeout=WIRE_NEGOTIATE_TIMEOUT)
+    except Exception as e:
+        log.warning("Server không thoả thuận định dạng payload (%r), dùng JSON", e)
+        return
+    chosen = reply.get("format") if isinstance(reply, dict) else reply
+    if chosen in offered:
+        wire_format = chosen
+    print(f"✅ Định dạng payload tag_data: {wire_format}")
+
+async def on_connected():
+    await negotiate_wire_format()
+    if has_backlog():
+        log.info("Gửi lại dữ liệu tồn đọng (outbox: %s frame)...", len(outbox), extra={"icon": "🔄"})
+        await drain_outbox()
+
+@sio.event
+async def connect():
+    # Không chờ server trả lời ngay trong handler connect (sẽ chặn vòng đọc của socketio)
+    asyncio.create_task(on_connected())
 
 @sio.event
 async def disconnect():
@@ -75,8 +385,6 @@ async def stop_tracking(data=None):
 
 @sio.on("update-device")
 async def update_device_handler(msg):
-    from ble_hanlder import set_operation_mode, set_location_mode, set_anchor_location, set_tag_rate
-
     cmd = msg.get("command")
     data = msg.get("data", {})
     mac_address = data.get("mac")
@@ -87,26 +395,62 @@ async def update_device_handler(msg):
         print(f"Nhan lenh: {cmd} cho {mac_address}, payload: {payload}")
         await command_queue.put((cmd, mac_address, payload))
 
+    await run_device_command(cmd, mac_address, payload)
+
+async def run_device_command(cmd, mac_address, payload) -> bool:
+    """Thực hiện một lệnh cấu hình (set-operation-mode, set_tag_rate, ...) cho một thiết bị."""
+    from ble_hanlder import set_operation_mode, set_location_mode, set_anchor_location, set_tag_rate
 
     is_tag = mac_address in TAG_MAC_LIST
     is_anchor = mac_address in ANCHOR_MAC_LIST
 
     if not (is_tag or is_anchor):
         print(f"Khong tim thay {mac_address} trong danh sach thiet bi")
-        return
+        return False
+    cmd = (cmd or "").replace("_", "-")
+    device_type = "tag" if is_tag else "anchor"
     if cmd == "set-operation-mode":
-        if is_tag:
-            set_operation_mode(mac_address, payload, device_type = "tag")
-        else:
-            set_operation_mode(mac_address, payload, device_type = "anchor")
+        return await set_operation_mode(mac_address, payload, device_type=device_type)
     elif cmd == "set-location-mode":
-        if is_tag:
-            set_location_mode(mac_address,payload,device_type="tag")
-        else:
-            set_location_mode(mac_address,payload,device_type="anchor")
+        return await set_location_mode(mac_address, payload, device_type=device_type)
     elif cmd == "set-anchor-location":
-        set_anchor_location(mac_address,payload)
+        return await set_anchor_location(mac_address, payload)
     elif cmd == "set-tag-rate":
-        set_tag_rate(mac_address,payload)
+        return await set_tag_rate(mac_address, payload)
+    print(f"Lenh khong hop le: {cmd}")
+    return False
+
+@sio.on("bulk_update")
+async def bulk_update_handler(msg):
+    """Chạy nhiều lệnh [{mac, command, payload}, ...] song song (giới hạn BLE_MAX_CONNECTIONS).
 
+    Mỗi lệnh xong sẽ gửi ngay "bulk_update_result", hết lô gửi "bulk_update_done".
+    """
+    request_id = msg.get("id")
+    items = msg.get("items", [])
+    print(f"Nhan bulk_update {request_id}: {len(items)} lenh")
+
+    async def run(index, item):
+        mac_address = cmd = None
+        try:
+            # Phần tử sai định dạng chỉ được báo lỗi, không làm dừng cả lô
+            if isinstance(item, dict):
+                mac_address, cmd, payload = item.get("mac"), item.get("command"), item.get("payload")
+            else:
+                mac_address, cmd, payload = item
+            async with bulk_semaphore:
+                is_succeed = await run_device_command(cmd, mac_address, payload)
+        except Exception as e:
+            frame_log.error("Lỗi bulk_update %s cho %s: %s", cmd, mac_address, e)
+            is_succeed = False
+        await safe_emit("bulk_update_result", {
+            "id": request_id,
+            "index": index,
+            "mac": mac_address,
+            "command": cmd,
+            "result": "success" if is_succeed else "error"
+        })
+        return is_succeed
 
+    results = await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+    await safe_emit("bulk_update_done", {"id": request_id, "total": len(results), "success": sum(results)})
@@ -0,0 +1,144 @@
+import asyncio
+
+import numpy as np
+
+STATE_SIZE = 6  # x, y, z, vx, vy, vz
+
+
+class TagKalmanBank:
+    """Bộ lọc Kalman vận tốc không đổi 3-D cho nhiều tag, trạng thái xếp chồng trong mảng NumPy.
+
+    Mỗi lần update_batch chạy predict/update cho tất cả tag trong lô bằng phép nhân ma trận
+    theo lô; dt lấy từ timestamp thực của từng frame.
+    - process_noise: mật độ phổ gia tốc (m^2/s^3)
+    - measurement_noise: độ lệch chuẩn phép đo vị trí (m)
+    - max_gap: quá thời gian này (s) không có dữ liệu thì khởi tạo lại trạng thái tag
+    """
+
+    def __init__(self, process_noise, measurement_noise, max_gap, capacity=64):
+        self.process_noise = process_noise
+        self.R = np.eye(3) * measurement_noise ** 2
+        self.max_gap = max_gap
+        self.index = {}
+        self.x = np.zeros((capacity, STATE_SIZE))
+        self.P = np.zeros((capacity, STATE_SIZE, STATE_SIZE))
+        self.t = np.zeros(capacity)
+
+    def _row(self, mac):
+        row = self.index.get(mac)
+        if row is None:
+            row = self.index[mac] = len(self.index)
+            if row >= len(self.t):
+                grow = len(self.t)
+                self.x = np.concatenate([self.x, np.zeros((grow, STATE_SIZE))])
+                self.P = np.concatenate([self.P, np.zeros((grow, STATE_SIZE, STATE_SIZE))])
+                self.t = np.concatenate([self.t, np.zeros(grow)])
+            self.t[row] = -np.inf
+        return row
+
+    def _reset(self, rows, z, timestamps):
+        self.x[rows, :3] = z
+        self.x[rows, 3:] = 0
+        self.P[rows] = 0
+        self.P[rows, :3, :3] = self.R
+        self.P[rows, 3:, 3:] = np.eye(3) * 1.0  # Vận tốc ban đầu chưa biết (m/s)^2
+        self.t[rows] = timestamps
+
+    def update_batch(self, macs, positions, timestamps):
+        """Lọc một lô phép đo; mỗi mac chỉ xuất hiện một lần trong lô.
+
+        positions: (k, 3) đơn vị mét, timestamps: (k,) giây. Trả về vị trí đã lọc (k, 3).
+        """
+        rows = np.array([self._row(mac) for mac in macs], dtype=np.intp)
+        z = np.asarray(positions, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+
+        dt = timestamps - self.t[rows]
+        fresh = ~(dt <= self.max_gap)  # Tag mới (t = -inf) hoặc mất dữ liệu quá lâu
+        if fresh.any():
+            self._reset(rows[fresh], z[fresh], timestamps[fresh])
+        active = ~fresh
+        if not active.any():
+            return z
+
+        r = rows[active]
+        dt = np.clip(dt[active], 0.0, None)
+        k = len(r)
+
+        # Predict: x = F x, P = F P F^T + Q
+        F = np.tile(np.eye(STATE_SIZE), (k, 1, 1))
+        F[:, 0, 3] = F[:, 1, 4] = F[:, 2, 5] = dt
+        dt2, dt3, dt4 = dt ** 2, dt ** 3, dt ** 4
+        Q = np.zeros((k, STATE_SIZE, STATE_SIZE))
+        for axis in range(3):
+            Q[:, axis, axis] = dt4 / 4
+            Q[:, axis, axis + 3] = Q[:, axis + 3, axis] = dt3 / 2
+            Q[:, axis + 3, axis + 3] = dt2
+        Q *= self.process_noise
+
+        x = np.einsum("kij,kj->ki", F, self.x[r])
+        P = F @ self.P[r] @ F.transpose(0, 2, 1) + Q
+
+        # Update với H = [I3 0]
+        S = P[:, :3, :3] + self.R
+        K = P[:, :, :3] @ np.linalg.inv(S)
+        innovation = z[active] - x[:, :3]
+        x = x + np.einsum("kij,kj->ki", K, innovation)
+        P = P - K @ P[:, :3, :]
+
+        self.x[r] = x
+        self.P[r] = P
+        self.t[r] = timestamps[active]
+
+        filtered = z.copy()
+        filtered[active] = x[:, :3]
+        return filtered
+
+
+class SmoothingStage:
+    """Gom các frame có vị trí trong mỗi tick rồi lọc toàn bộ bằng TagKalmanBank.
+
+    Frame đã lọc (toạ độ mm trong PositionFix được thay bằng giá trị lọc) được gửi qua emit.
+    """
+
+    def __init__(self, bank, tick, emit):
+        self.bank = bank
+        self.tick = tick
+        self.emit = emit
+        self.pending = []
+
+    def submit(self, address, frame, received_at):
+        self.pending.append((address, frame, received_at))
+
+    def process(self, items):
+        # Một tag có thể có nhiều frame trong một tick: chia thành nhiều vòng, mỗi vòng một frame/tag
+        rounds = []
+        seen_count = {}
+        for item in items:
+            n = seen_count.get(item[0], 0)
+            seen_count[item[0]] = n + 1
+            if n == len(rounds):
+                rounds.append([])
+            rounds[n].append(item)
+
+        for batch in rounds:
+            positions = [(f.position.x / 1000, f.position.y / 1000, f.position.z / 1000)
+                         for _, f, _ in batch]
+            filtered = self.bank.update_batch([a for a, _, _ in batch], positions,
+                                              [t for _, _, t in batch])
+            for (_, frame, _), (x, y, z) in zip(batch, np.rint(filtered * 1000).astype(int).tolist()):
+                frame.position.x, frame.position.y, frame.position.z = x, y, z
+        return items
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            if not self.pending:
+                continue
+            items, self.pending = self.pending, []
+            try:
+                self.process(items)
+            except Exception as e:
+                print(f"❌ Lỗi bộ lọc Kalman: {e}")
+            for address, frame, _ in items:
+                await self.emit(address, frame)
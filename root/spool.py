@@ -0,0 +1,275 @@
+import asyncio
+import os
+import struct
+import zlib
+
+from logger import log
+from wire import mac_to_bytes, bytes_to_mac
+
+# Bản ghi: [len:u16][crc32:u32] + body, body = [timestamp:f64][mac:6 byte] + frame BLE gốc
+RECORD_HEADER = struct.Struct("<H I")
+BODY_PREFIX = struct.Struct("<d 6s")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+class FrameSpool:
+    """Spool trên đĩa (các file segment chỉ ghi nối) cho frame chưa gửi được.
+
+    - append() chỉ đưa bản ghi vào bộ đệm trong RAM; bộ đệm được ghi xuống đĩa sau
+      flush_interval giây (hoặc ngay khi đủ segment_bytes) bằng một lần write + fsync
+      trong thread riêng, nên event loop không bị chặn bởi I/O.
+    - Segment được xoay vòng khi vượt segment_bytes; tổng dung lượng vượt max_bytes
+      thì xoá segment cũ nhất.
+    - Khi khởi động, phần đuôi ghi dở (sai độ dài hoặc CRC) bị cắt bỏ.
+    - Đọc lại tuần tự theo lô qua một file handle giữ mở; vị trí đã gửi được lưu vào file
+      cursor để không gửi lại sau khi khởi động lại (trừ lô đang gửi dở).
+    """
+
+    def __init__(self, directory, segment_bytes, max_bytes, flush_interval=0.5):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.dropped_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        self.sizes = {}
+        self._cursor = self._load_cursor()
+        self._recover()
+
+        self._file = None
+        self._active = None
+        self._reader = None
+        self._reader_segment = None
+        self._reader_offset = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._flush_timer = None
+        self._flush_soon = False
+        self._io_lock = asyncio.Lock()  # Mỗi lúc chỉ một thao tác đĩa chạy trong thread
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    def _cursor_offset(self, segment):
+        return self._cursor[1] if self._cursor and self._cursor[0] == segment else 0
+
+    @property
+    def pending(self):
+        return bool(self._buffer) or self._pending_on_disk()
+
+    def _pending_on_disk(self):
+        if not self.segments:
+            return False
+        if len(self.segments) == 1:
+            segment = self.segments[0]
+            return self.sizes.get(segment, 0) > self._cursor_offset(segment)
+        return True
+
+    # ---------- Khôi phục ----------
+    def _scan(self, path):
+        """Trả về offset kết thúc của bản ghi hợp lệ cuối cùng."""
+        valid_end = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        while valid_end + RECORD_HEADER.size <= len(data):
+            length, crc = RECORD_HEADER.unpack_from(data, valid_end)
+            start = valid_end + RECORD_HEADER.size
+            body = data[start:start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            valid_end = start + length
+        return valid_end
+
+    def _recover(self):
+        for segment in list(self.segments):
+            path = self._path(segment)
+            valid_end = self._scan(path)
+            if valid_end < os.path.getsize(path):
+                print(f"⚠️ Spool: cắt bỏ bản ghi hỏng ở cuối {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+            if valid_end == 0:
+                os.remove(path)
+                self.segments.remove(segment)
+                continue
+            self.sizes[segment] = valid_end
+        if self._cursor and self._cursor[0] not in self.sizes:
+            self._cursor = None
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r", encoding="utf-8") as f:
+                segment, offset = f.read().split()
+            return int(segment), int(offset)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        if self._cursor is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        temp_path = path + ".temp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(temp_path, path)
+
+    # ---------- Ghi ----------
+    def append(self, mac, frame_bytes, timestamp):
+        """Thêm bản ghi vào bộ đệm (không I/O); phải gọi từ trong event loop."""
+        body = BODY_PREFIX.pack(timestamp, mac_to_bytes(mac)) + frame_bytes
+        record = RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+        self._buffer.append(record)
+        self._buffer_bytes += len(record)
+        if self._buffer_bytes >= self.segment_bytes and not self._flush_soon:
+            self._flush_soon = True
+            self._schedule_flush(0)
+        elif self._flush_timer is None:
+            self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = asyncio.get_running_loop().call_later(delay, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_timer = None
+        asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Ghi bộ đệm xuống đĩa: một lần fsync cho cả lô."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        async with self._io_lock:
+            records, self._buffer, self._buffer_bytes = self._buffer, [], 0
+            self._flush_soon = False
+            if records:
+                await asyncio.to_thread(self._write, records)
+
+    def _write(self, records):
+        for record in records:
+            if self._file is None or self.sizes[self._active] >= self.segment_bytes:
+                self._open_segment()
+            self._file.write(record)
+            self.sizes[self._active] += len(record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._enforce_limit()
+
+    def _seal(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._active = None
+
+    def _open_segment(self):
+        self._seal()
+        segment = self.segments[-1] + 1 if self.segments else 1
+        self._file = open(self._path(segment), "ab")
+        self._active = segment
+        self.sizes[segment] = 0
+        self.segments.append(segment)
+
+    def _enforce_limit(self):
+        while len(self.segments) > 1 and sum(self.sizes.values()) > self.max_bytes:
+            self._drop_segment(self.segments[0])
+            log.warning("Spool vượt %s byte, đã xoá segment cũ nhất!", self.max_bytes)
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+            self._reader_segment = None
+
+    def _remove_segment(self, segment):
+        if segment == self._reader_segment:
+            self._close_reader()
+        os.remove(self._path(segment))
+        self.segments.remove(segment)
+        del self.sizes[segment]
+
+    def _drop_segment(self, segment):
+        self.dropped_bytes += self.sizes[segment] - self._cursor_offset(segment)
+        self._remove_segment(segment)
+        if self._cursor and self._cursor[0] == segment:
+            self._cursor = None
+            self._save_cursor()
+
+    # ---------- Đọc lại ----------
+    async def read_batch(self, size):
+        """Đọc tối đa size bản ghi từ segment cũ nhất.
+
+        Trả về (records, position) với records = list (mac, timestamp, frame_bytes, end):
+        end là vị trí ngay sau bản ghi đó; gọi commit(end) sau khi gửi thành công đến bản ghi này,
+        hoặc commit(position) khi đã gửi cả lô (position bỏ qua cả phần hỏng phía sau nếu có).
+        """
+        if not self._pending_on_disk() and self._buffer:
+            await self.flush()
+        async with self._io_lock:
+            if not self._pending_on_disk():
+                return [], None
+            return await asyncio.to_thread(self._read, size)
+
+    def _read(self, size):
+        segment = self.segments[0]
+        offset = self._cursor_offset(segment)
+        end = self.sizes[segment]  # Chỉ đọc phần đã ghi xong (segment đang ghi vẫn có thể dài thêm)
+        if self._reader_segment != segment:
+            self._close_reader()
+            self._reader = open(self._path(segment), "rb")
+            self._reader_segment = segment
+            self._reader_offset = -1
+        if self._reader_offset != offset:
+            self._reader.seek(offset)
+
+        records = []
+        pos = offset
+        while len(records) < size and pos + RECORD_HEADER.size <= end:
+            length, crc = RECORD_HEADER.unpack(self._reader.read(RECORD_HEADER.size))
+            start = pos + RECORD_HEADER.size
+            body = self._reader.read(min(length, end - start))
+            if len(body) < length or zlib.crc32(body) != crc:
+                pos = end  # Phần còn lại hỏng, bỏ qua
+                self._reader.seek(end)
+                break
+            pos = start + length
+            timestamp, mac = BODY_PREFIX.unpack_from(body)
+            records.append((bytes_to_mac(mac), timestamp, body[BODY_PREFIX.size:], (segment, pos)))
+        self._reader_offset = pos
+        return records, (segment, pos)
+
+    async def commit(self, position):
+        async with self._io_lock:
+            await asyncio.to_thread(self._commit, position)
+
+    def _commit(self, position):
+        segment, offset = position
+        if segment not in self.sizes:
+            return
+        if offset >= self.sizes[segment] and segment != self._active:
+            self._remove_segment(segment)
+            self._cursor = None
+        else:
+            # Segment đang ghi được giữ lại (cursor ở cuối) thay vì đóng và mở segment mới
+            self._cursor = (segment, offset)
+        self._save_cursor()
+
+    async def close(self):
+        """Ghi nốt bộ đệm và đóng các file; gọi khi tắt gateway."""
+        await self.flush()
+        async with self._io_lock:
+            await asyncio.to_thread(self._close)
+
+    def _close(self):
+        self._seal()
+        self._close_reader()
@@ -0,0 +1,345 @@
+import asyncio
+import math
+import random
+
+from config import (LOCATION_DATA_UUID, LOCATION_DATA_MODE_UUID, OPERATION_MODE_UUID, LABEL_CHAR_UUID,
+                    UPDATE_RATE_UUID, PERSISTED_POSITION, BLE_TRANSPORT,
+                    SIM_TAG_COUNT, SIM_ANCHOR_COUNT, SIM_RATE_HZ, SIM_LOCATION_MODE, SIM_DROP_RATE,
+                    SIM_DISCONNECT_RATE, SIM_CONNECT_FAIL_RATE, SIM_ADV_INTERVAL, SIM_SEED)
+from helper import LocationFrame, PositionFix, RangeMeasurement, encode_location_frame
+
+SIM_TAG_NODE_BASE = 0xD000  # Tên tag: DWDxxx
+SIM_ANCHOR_NODE_BASE = 0xC000  # Tên anchor: DWCxxx
+SIM_MAX_DEVICES = 0x1000
+SIM_MAX_RANGES = 4  # DWM1001 báo khoảng cách đến tối đa 4 anchor gần nhất
+
+
+class BleakTransport:
+    """Backend thật: mọi truy cập BLE đi qua bleak."""
+    name = "bleak"
+    tag_addresses = None
+    anchor_addresses = None
+
+    def __init__(self):
+        from bleak import BleakClient, BleakScanner, BleakError
+        self.client_class = BleakClient
+        self.scanner_class = BleakScanner
+        self.error = BleakError
+
+    def client(self, address, adapter=None):
+        if adapter:
+            return self.client_class(address, adapter=adapter)
+        return self.client_class(address)
+
+    def scanner(self, **kwargs):
+        return self.scanner_class(**kwargs)
+
+    async def discover(self, timeout):
+        return await self.scanner_class.discover(timeout)
+
+
+class SimulatedBleError(Exception):
+    pass
+
+
+class SimDevice:
+    """Một tag/anchor ảo. Quỹ đạo và nhiễu chỉ phụ thuộc seed và số thứ tự frame (seq)."""
+    __slots__ = ("address", "name", "node_id", "is_anchor", "position", "rng", "seq", "chars",
+                 "center", "radius", "omega", "phase")
+
+    def __init__(self, address, node_id, is_anchor, position, seed):
+        self.address = address
+        self.node_id = node_id
+        self.name = f"DW{node_id:04X}"
+        self.is_anchor = is_anchor
+        self.position = position
+        self.rng = random.Random(f"{seed}:{address}")
+        self.seq = 0
+        self.chars = {}
+        self.center = self.radius = self.omega = self.phase = None
+
+    @property
+    def location_mode(self):
+        return self.chars[LOCATION_DATA_MODE_UUID][0]
+
+    @property
+    def period(self):
+        u1 = int.from_bytes(self.chars[UPDATE_RATE_UUID][:4], byteorder="little")
+        return u1 / 1000 if u1 > 0 else 1.0
+
+
+class SimDeviceInfo:
+    __slots__ = ("address", "name")
+
+    def __init__(self, address, name):
+        self.address = address
+        self.name = name
+
+
+class SimAdvertisement:
+    __slots__ = ("local_name", "rssi", "manufacturer_data", "service_data", "service_uuids", "tx_power")
+
+    def __init__(self, local_name, rssi, service_data):
+        self.local_name = local_name
+        self.rssi = rssi
+        self.manufacturer_data = {}
+        self.service_data = service_data
+        self.service_uuids = list(service_data)
+        self.tx_power = None
+
+
+class SimulatedClient:
+    """Giả lập BleakClient: connect/disconnect, đọc/ghi characteristic, notify location."""
+
+    def __init__(self, transport, address, adapter=None):
+        self.transport = transport
+        self.address = address
+        self.adapter = adapter
+        self.device = transport.devices.get(address)
+        self.is_connected = False
+        self._notify_task = None
+
+    async def connect(self):
+        transport = self.transport
+        if self.device is None:
+            raise SimulatedBleError(f"Không tìm thấy thiết bị {self.address}")
+        await asyncio.sleep(transport.connect_delay)
+        if self.device.rng.random() < transport.connect_fail_rate:
+            raise SimulatedBleError(f"Kết nối thất bại (giả lập) {self.address}")
+        self.is_connected = True
+        transport.connected.add(self.address)
+        return True
+
+    async def disconnect(self):
+        self._drop()
+        await asyncio.sleep(0)
+        return True
+
+    def _drop(self):
+        if self.is_connected:
+            self.is_connected = False
+            self.transport.connected.discard(self.address)
+        task, self._notify_task = self._notify_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    def _require_connected(self):
+        if not self.is_connected:
+            raise SimulatedBleError(f"Chưa kết nối {self.address}")
+
+    async def read_gatt_char(self, char_uuid):
+        self._require_connected()
+        device = self.device
+        if char_uuid == LOCATION_DATA_UUID:
+            return bytearray(self.transport.next_frame(device))
+        if char_uuid == LABEL_CHAR_UUID:
+            return bytearray(device.name.encode())
+        if char_uuid not in device.chars:
+            raise SimulatedBleError(f"Characteristic {char_uuid} không tồn tại trên {self.address}")
+        return bytearray(device.chars[char_uuid])
+
+    async def write_gatt_char(self, char_uuid, data, response=None):
+        self._require_connected()
+        self.device.chars[char_uuid] = bytes(data)
+
+    async def start_notify(self, char_uuid, callback, **kwargs):
+        self._require_connected()
+        if char_uuid != LOCATION_DATA_UUID:
+            raise SimulatedBleError(f"Characteristic {char_uuid} không hỗ trợ notify")
+        if self._notify_task is not None:
+            raise SimulatedBleError(f"Notify đã bật trên {self.address}")
+        self._notify_task = asyncio.create_task(self._notify_loop(char_uuid, callback))
+
+    async def stop_notify(self, char_uuid):
+        task, self._notify_task = self._notify_task, None
+        if task is not None:
+            task.cancel()
+
+    async def _notify_loop(self, char_uuid, callback):
+        transport, device = self.transport, self.device
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while self.is_connected:
+            period = device.period
+            next_at += period
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_at = loop.time()  # Chậm hơn lịch thì không dồn frame bù
+            data = transport.next_frame(device)
+            if device.rng.random() < transport.disconnect_rate * period:
+                print(f"🔌 (giả lập) {self.address} mất kết nối")
+                self._drop()
+                return
+            if device.rng.random() < transport.drop_rate:
+                transport.dropped += 1
+                continue
+            transport.notified += 1
+            callback(char_uuid, bytearray(data))
+
+
+class SimulatedScanner:
+    """Giả lập BleakScanner: mọi thiết bị ảo quảng bá mỗi adv_interval giây.
+
+    Tag đang không kết nối mang frame location trong service data (LOCATION_DATA_UUID).
+    Các tham số riêng của backend (bluez, ...) được bỏ qua.
+    """
+
+    def __init__(self, transport, detection_callback=None, scanning_mode="active", **kwargs):
+        self.transport = transport
+        self.detection_callback = detection_callback
+        self.scanning_mode = scanning_mode
+        self.discovered = {}
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._advertise_loop())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+
+    async def _advertise_loop(self):
+        transport = self.transport
+        while True:
+            for device in transport.devices.values():
+                service_data = {}
+                if not device.is_anchor and device.address not in transport.connected:
+                    service_data[LOCATION_DATA_UUID] = transport.next_frame(device)
+                info = SimDeviceInfo(device.address, device.name)
+                self.discovered[device.address] = info
+                if self.detection_callback is not None:
+                    self.detection_callback(info, SimAdvertisement(device.name, transport.rssi(device),
+                                                                   service_data))
+            await asyncio.sleep(transport.adv_interval)
+
+
+class SimulatedTransport:
+    """Backend giả lập để đo tải không cần phần cứng.
+
+    Sinh notify location mode 0/1/2 đúng bố cục struct của DWM1001 cho hàng nghìn tag ảo
+    chạy vòng tròn trong vùng có anchor_count anchor. Cùng seed thì cùng chuỗi frame,
+    cùng chuỗi frame bị mất và cùng thời điểm mất kết nối (tính theo số frame).
+    - rate_hz: tần số notify mặc định của tag (ghi UPDATE_RATE_UUID để đổi từng tag)
+    - location_mode: mode mặc định (ghi LOCATION_DATA_MODE_UUID để đổi từng tag)
+    - drop_rate: xác suất mất một notify
+    - disconnect_rate: số lần mất kết nối trung bình mỗi giây của một tag
+    - connect_fail_rate: xác suất một lần connect thất bại
+    """
+    name = "sim"
+
+    def __init__(self, tag_count, anchor_count, rate_hz=10.0, location_mode=2, drop_rate=0.0,
+                 disconnect_rate=0.0, connect_fail_rate=0.0, adv_interval=1.0, seed=1,
+                 area=20.0, connect_delay=0.0):
+        if tag_count > SIM_MAX_DEVICES or anchor_count > SIM_MAX_DEVICES:
+            raise ValueError(f"Tối đa {SIM_MAX_DEVICES} tag và {SIM_MAX_DEVICES} anchor giả lập")
+        self.error = SimulatedBleError
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.connect_fail_rate = connect_fail_rate
+        self.adv_interval = adv_interval
+        self.connect_delay = connect_delay
+        self.connected = set()  # Địa chỉ đang có kết nối GATT (không quảng bá frame)
+        self.notified = 0
+        self.dropped = 0
+        self.devices = {}
+
+        rng = random.Random(seed)
+        half = area / 2
+        self.anchor_addresses = []
+        for i in range(anchor_count):
+            # Anchor trên đường tròn quanh vùng, độ cao xen kẽ để hệ không đồng phẳng
+            angle = 2 * math.pi * i / max(anchor_count, 1)
+            position = (half + half * math.cos(angle), half + half * math.sin(angle), 2.5 if i % 2 else 2.0)
+            address = f"5A:41:00:00:{i >> 8:02X}:{i & 0xFF:02X}"
+            device = SimDevice(address, SIM_ANCHOR_NODE_BASE + i, True, position, seed)
+            device.chars = self._default_chars(True, 0, 1.0)
+            self.devices[address] = device
+            self.anchor_addresses.append(address)
+
+        self.tag_addresses = []
+        for i in range(tag_count):
+            address = f"5A:54:00:00:{i >> 8:02X}:{i & 0xFF:02X}"
+            device = SimDevice(address, SIM_TAG_NODE_BASE + i, False, None, seed)
+            device.center = (rng.uniform(0.3, 0.7) * area, rng.uniform(0.3, 0.7) * area)
+            device.radius = rng.uniform(0.5, 0.25 * area)
+            device.omega = rng.uniform(0.05, 0.5)  # rad/s
+            device.phase = rng.uniform(0, 2 * math.pi)
+            device.chars = self._default_chars(False, location_mode, rate_hz)
+            self.devices[address] = device
+            self.tag_addresses.append(address)
+
+    @staticmethod
+    def _default_chars(is_anchor, location_mode, rate_hz):
+        period_ms = int(1000 / rate_hz) if rate_hz > 0 else 1000
+        return {
+            OPERATION_MODE_UUID: bytes([0x80 if is_anchor else 0x00, 0x00]),
+            LOCATION_DATA_MODE_UUID: bytes([location_mode]),
+            UPDATE_RATE_UUID: period_ms.to_bytes(4, "little") + period_ms.to_bytes(4, "little"),
+            PERSISTED_POSITION: bytes(13),
+        }
+
+    def client(self, address, adapter=None):
+        return SimulatedClient(self, address, adapter)
+
+    def scanner(self, **kwargs):
+        return SimulatedScanner(self, **kwargs)
+
+    async def discover(self, timeout):
+        return [SimDeviceInfo(d.address, d.name) for d in self.devices.values()]
+
+    def true_position(self, device):
+        """Vị trí thật (m) của thiết bị ở frame hiện tại."""
+        if device.is_anchor:
+            return device.position
+        t = device.seq * device.period
+        angle = device.phase + device.omega * t
+        return (device.center[0] + device.radius * math.cos(angle),
+                device.center[1] + device.radius * math.sin(angle),
+                1.0)
+
+    def rssi(self, device):
+        x, y, z = self.true_position(device)
+        distance = max(math.sqrt(x * x + y * y + z * z), 1.0)
+        return int(max(-100, -45 - 20 * math.log10(distance) + device.rng.gauss(0, 2)))
+
+    def next_frame(self, device):
+        """Sinh frame location tiếp theo (bytes) theo location mode hiện tại của thiết bị."""
+        rng = device.rng
+        x, y, z = self.true_position(device)
+        device.seq += 1
+        mode = device.location_mode
+        position = None
+        distances = ()
+        if mode != 1:
+            noise = 0.0 if device.is_anchor else 0.02
+            position = PositionFix(round((x + rng.gauss(0, noise)) * 1000),
+                                   round((y + rng.gauss(0, noise)) * 1000),
+                                   round((z + rng.gauss(0, noise)) * 1000),
+                                   100 if device.is_anchor else rng.randint(50, 100))
+        if mode != 0:
+            ranges = []
+            for address in self.anchor_addresses:
+                anchor = self.devices[address]
+                ax, ay, az = anchor.position
+                ranges.append((math.sqrt((x - ax) ** 2 + (y - ay) ** 2 + (z - az) ** 2), anchor.node_id))
+            ranges.sort()
+            distances = tuple(
+                RangeMeasurement(node_id, max(0, round((d + rng.gauss(0, 0.03)) * 1000)), rng.randint(60, 100))
+                for d, node_id in ranges[:SIM_MAX_RANGES]
+            )
+        return encode_location_frame(LocationFrame(mode, position, distances))
+
+
+def get_transport(name=BLE_TRANSPORT):
+    """Tạo backend BLE theo tên: "bleak" (phần cứng thật) hoặc "sim" (giả lập, cấu hình SIM_*)."""
+    if name == "bleak":
+        return BleakTransport()
+    if name == "sim":
+        return SimulatedTransport(SIM_TAG_COUNT, SIM_ANCHOR_COUNT, SIM_RATE_HZ, SIM_LOCATION_MODE,
+                                  SIM_DROP_RATE, SIM_DISCONNECT_RATE, SIM_CONNECT_FAIL_RATE,
+                                  SIM_ADV_INTERVAL, SIM_SEED)
+    raise ValueError(f"BLE transport không hỗ trợ: {name}")
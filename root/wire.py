@@ -0,0 +1,114 @@
+import struct
+
+from helper import encode_location_frame, decode_location_frame
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tuỳ chọn, thiếu thì chỉ dùng json/packed
+    msgpack = None
+
+# Định dạng payload tag_data / tag_data_batch gửi lên server:
+#   json:    {"mac": ..., "data": {"Position": {...}, "Distances": [...]}} (mặc định, như cũ)
+#   msgpack: [mac, mode, [x, y, z, q] | None, [node_id, distance, q, ...]] (đơn vị mm, không tên trường)
+#   packed:  [mac 6 byte][độ dài frame u16][frame đúng bố cục BLE] (helper.encode_location_frame)
+# Lô (tag_data_batch): json {"frames": [...]}, msgpack list các phần tử trên (+ time nếu có),
+# packed nối các bản ghi [mac 6 byte][time f64, 0 nếu không có][độ dài u16][frame].
+WIRE_FORMATS = ("json", "msgpack", "packed")
+PACKED_HEADER = struct.Struct("<6s H")
+PACKED_BATCH_HEADER = struct.Struct("<6s d H")
+# tag_raw_batch (chế độ chuyển tiếp thô): [phiên bản u8][time.time() f64][time.monotonic() f64][số bản ghi u16]
+# rồi các bản ghi [mac 6 byte][seq u32][thời điểm nhận monotonic f64][độ dài u16][payload BLE nguyên gốc].
+# Cặp thời gian ở header cho phép server đổi thời điểm monotonic sang giờ thực.
+RAW_BATCH_VERSION = 1
+RAW_BATCH_HEADER = struct.Struct("<B d d H")
+RAW_RECORD_HEADER = struct.Struct("<6s I d H")
+
+
+def available_formats():
+    return tuple(f for f in WIRE_FORMATS if f != "msgpack" or msgpack is not None)
+
+
+def mac_to_bytes(mac):
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def bytes_to_mac(data):
+    return ":".join(f"{b:02X}" for b in data)
+
+
+def _compact(mac, frame):
+    p = frame.position
+    ranges = []
+    for d in frame.distances:
+        ranges += (d.node_id, d.distance, d.quality)
+    return [mac, frame.mode, [p.x, p.y, p.z, p.quality] if p is not None else None, ranges]
+
+
+def encode_tag_data(fmt, mac, frame):
+    """Payload của một event tag_data theo định dạng đã thoả thuận."""
+    if fmt == "packed":
+        data = encode_location_frame(frame)
+        return PACKED_HEADER.pack(mac_to_bytes(mac), len(data)) + data
+    if fmt == "msgpack":
+        return msgpack.packb(_compact(mac, frame))
+    return {"mac": mac, "data": frame.to_dict()}
+
+
+def encode_tag_batch(fmt, items):
+    """Payload của tag_data_batch; items là các (mac, frame) hoặc (mac, frame, time)."""
+    if fmt == "packed":
+        parts = []
+        for item in items:
+            data = encode_location_frame(item[1])
+            timestamp = item[2] if len(item) > 2 else 0.0
+            parts.append(PACKED_BATCH_HEADER.pack(mac_to_bytes(item[0]), timestamp, len(data)))
+            parts.append(data)
+        return b"".join(parts)
+    if fmt == "msgpack":
+        return msgpack.packb([_compact(item[0], item[1]) + list(item[2:]) for item in items])
+    frames = []
+    for item in items:
+        entry = {"mac": item[0], "data": item[1].to_dict()}
+        if len(item) > 2:
+            entry["time"] = item[2]
+        frames.append(entry)
+    return {"frames": frames}
+
+
+def decode_packed_batch(payload):
+    """Ngược với encode_tag_batch("packed", ...): trả về list (mac, LocationFrame, time)."""
+    items = []
+    offset = 0
+    header_size = PACKED_BATCH_HEADER.size
+    while offset < len(payload):
+        mac, timestamp, length = PACKED_BATCH_HEADER.unpack_from(payload, offset)
+        offset += header_size
+        frame = decode_location_frame(payload[offset:offset + length])
+        offset += length
+        items.append((bytes_to_mac(mac), frame, timestamp))
+    return items
+
+
+def encode_raw_batch(records, wall_time, monotonic_time):
+    """records: các (mac, seq, received_at, data) với data là payload notify chưa giải mã."""
+    parts = [RAW_BATCH_HEADER.pack(RAW_BATCH_VERSION, wall_time, monotonic_time, len(records))]
+    pack = RAW_RECORD_HEADER.pack
+    for mac, seq, received_at, data in records:
+        parts.append(pack(mac_to_bytes(mac), seq, received_at, len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_raw_batch(payload):
+    """Ngược với encode_raw_batch: trả về (wall_time, monotonic_time, list (mac, seq, received_at, data))."""
+    version, wall_time, monotonic_time, count = RAW_BATCH_HEADER.unpack_from(payload, 0)
+    if version != RAW_BATCH_VERSION:
+        raise ValueError(f"Không hỗ trợ tag_raw_batch phiên bản {version}")
+    offset = RAW_BATCH_HEADER.size
+    records = []
+    for _ in range(count):
+        mac, seq, received_at, length = RAW_RECORD_HEADER.unpack_from(payload, offset)
+        offset += RAW_RECORD_HEADER.size
+        records.append((bytes_to_mac(mac), seq, received_at, bytes(payload[offset:offset + length])))
+        offset += length
+    return wall_time, monotonic_time, records
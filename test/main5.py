@@ -1,6 +1,7 @@
 import asyncio
 import time
 import struct
+import numpy as np
 import pytz
 import socketio
 from bleak import BleakClient, BleakScanner, BleakError
@@ -17,6 +18,9 @@ LAST_SENT_TIME = {}  # Lưu thời gian gửi gần nhất của từng tag
 INTERVAL = 5
 TIMEOUT = 5
 DISCONNECTED_TAGS = set()  # Danh sách Tag bị mất kết nối
+MIN_QUALITY_FACTOR = 30
+MIN_DISTANCES_COUNT = 3
+LOCATION_BATCH_SIZE = 64  # Số frame tối đa giải mã trong một lần
 
 location_queue = asyncio.Queue()
 command_queue = asyncio.Queue()
@@ -84,13 +88,14 @@ def decode_location_mode_0(data):
 
 
 # Distances Only
-def decode_location_mode_1(data):
+def decode_location_mode_1(data, count_offset=1):
+    # Frame đầy đủ: [mode][count] + count * 7 byte; mode 2 có count ở offset 14
     result = {}
     distances = []
-    distance_count = data[0]
+    distance_count = data[count_offset]
     result["Distances count:"] = distance_count
     for i in range(distance_count):
-        offset = 1 + i * 7
+        offset = count_offset + 1 + i * 7
         node_id, distance, quality = struct.unpack("<H i B", data[offset:offset + 7])
         distances.append({
             "Node ID": node_id,
@@ -105,12 +110,72 @@ def decode_location_mode_1(data):
 def decode_location_mode_2(data):
     result = {}
     mode_0 = decode_location_mode_0(data[:14])
-    mode_1 = decode_location_mode_1(data[14:])
+    mode_1 = decode_location_mode_1(data, 14)
     result.update(mode_0)
     result.update(mode_1)
     return result
 
 
+# Bản ghi khoảng cách 7 byte "<H i B" (packed, không padding)
+DISTANCE_DTYPE = np.dtype([("node_id", "<u2"), ("distance", "<i4"), ("quality", "u1")])
+
+
+def decode_distances_batch(frames):
+    """Giải mã phần khoảng cách của nhiều frame mode 1/2 bằng một lần np.frombuffer.
+
+    Trả về (counts, starts, node_ids, distances, qualities): counts/starts theo từng frame,
+    các cột còn lại nối liền cho tất cả frame (distances đơn vị mét).
+    Frame không có phần khoảng cách hoặc bị cắt cụt có count = 0.
+    """
+    counts = np.zeros(len(frames), dtype=np.int64)
+    chunks = []
+    record_size = DISTANCE_DTYPE.itemsize
+    for i, data in enumerate(frames):
+        mode = data[0] if len(data) else None
+        if mode == 1:
+            offset = 1
+        elif mode == 2:
+            offset = 14
+        else:
+            continue
+        if len(data) <= offset:
+            continue
+        count = data[offset]
+        end = offset + 1 + count * record_size
+        if len(data) < end:
+            continue
+        counts[i] = count
+        chunks.append(memoryview(data)[offset + 1:end])
+
+    records = np.frombuffer(b"".join(chunks), dtype=DISTANCE_DTYPE)
+    starts = np.zeros(len(frames), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    return (counts, starts, records["node_id"].astype(np.int64),
+            records["distance"] / 1000, records["quality"].astype(np.int64))
+
+
+def filter_distances_batch(counts, starts, qualities,
+                           min_count=MIN_DISTANCES_COUNT, min_quality=MIN_QUALITY_FACTOR):
+    """Mask theo frame: đủ số anchor và mọi khoảng cách đạt chất lượng tối thiểu.
+
+    Chất lượng nhỏ nhất được tính riêng trên [start, start + count) của từng frame,
+    nên frame bị loại (ít anchor) không ảnh hưởng đến frame bên cạnh:
+
+    >>> counts = np.array([3, 1, 3, 0, 3])
+    >>> starts = np.array([0, 3, 4, 7, 7])
+    >>> qualities = np.array([90, 90, 90, 10, 90, 90, 90, 20, 90, 90])
+    >>> filter_distances_batch(counts, starts, qualities, min_count=3, min_quality=50).tolist()
+    [True, False, True, False, False]
+    """
+    keep = counts >= max(min_count, 1)
+    if keep.any():
+        frame_index = np.repeat(np.arange(len(counts)), counts)
+        min_q = np.full(len(counts), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(min_q, frame_index, qualities)
+        keep &= min_q >= min_quality
+    return keep
+
+
 async def safe_emit(event, data) -> bool:
     if sio.connected:
         await sio.emit(event, data)
@@ -450,35 +515,51 @@ async def stop_tracking(data=None):
 
 async def notification_handler(sender, data, mac_addr):
     try:
-        decoded_data = decode_location_data(data)
-        min_quality_factor = 30
-        if "Distances count:" not in decoded_data or "Distances" not in decoded_data:
-            # print(f"{ICON_DICT["WARNING"]} Dữ liệu từ {mac_addr} không hợp lệ, bỏ qua...")
-            return
-        distances_count = decoded_data.get("Distances count:", 0)
-        distances_node = decoded_data.get("Distances", [])
-        if distances_count < 3:
-            # print(
-            #     f"{ICON_DICT["WARNING"]} Dữ liệu từ {mac_addr} có số lượng điểm đo quá ít (count={distances_count}), bỏ qua...")
-            return
-        for d in distances_node:
-            if d["Quality Factor"] < min_quality_factor:
-                # print(f"{ICON_DICT["WARNING"]} Dữ liệu từ {mac_addr} có chất lượng thấp, bỏ qua...")
-                return
-        # current_time = time.time()
-        await location_queue.put((mac_addr, decoded_data))
-        # print(f"{ICON_DICT["RECEIVE"]} Đã nhận notify từ {mac_addr}: {decoded_data}")
+        # Chỉ đưa frame thô vào hàng đợi, giải mã và lọc theo lô trong send_location_handler
+        location_queue.put_nowait((mac_addr, bytes(data), time.time()))
     except Exception as e:
         print(f"{ICON_DICT["ERROR"]} Lỗi trong notification_handler: {e}")
 
 
+def build_location_batch(items):
+    """Giải mã và lọc một lô (mac, data, time), trả về list (mac, location) hợp lệ."""
+    frames = [data for _, data, _ in items]
+    counts, starts, node_ids, distances, qualities = decode_distances_batch(frames)
+    keep = filter_distances_batch(counts, starts, qualities)
+
+    node_ids = node_ids.tolist()
+    distances = distances.tolist()
+    qualities = qualities.tolist()
+    locations = []
+    for i in np.flatnonzero(keep).tolist():
+        mac_addr, data, _ = items[i]
+        location = decode_location_mode_0(data[:14]) if data[0] == 2 else {}
+        start, count = int(starts[i]), int(counts[i])
+        location["Distances count:"] = count
+        location["Distances"] = [{
+            "Node ID": node_ids[j],
+            "Distance": distances[j],
+            "Quality Factor": qualities[j]
+        } for j in range(start, start + count)]
+        locations.append((mac_addr, location))
+    return locations
+
+
 async def send_location_handler():
     global TRACKING_ENABLED, LAST_SENT_TIME, INTERVAL
     while True:  # Luôn chạy để xử lý dữ liệu mới
-        address, location, old_time = await location_queue.get()  # Chờ dữ liệu mới
+        items = [await location_queue.get()]  # Chờ dữ liệu mới
+        while len(items) < LOCATION_BATCH_SIZE and not location_queue.empty():
+            items.append(location_queue.get_nowait())
+
+        try:
+            locations = build_location_batch(items)
+        except Exception as e:
+            print(f"Lỗi giải mã lô dữ liệu ở send_location_handler: {e}!")
+            continue
 
         current_time = time.time()
-        if address is not None and location is not None:
+        for address, location in locations:
             try:
                 if TRACKING_ENABLED:
                     if await safe_emit("tag_data", {"mac": address, "data": location}):
@@ -489,9 +570,9 @@ async def send_location_handler():
                         if await safe_emit("tag_data", {"mac": address, "data": location}):
                             print(f"📡 Tag [{address}] gửi dữ liệu ({ICON_DICT["CLOCK"]}={INTERVAL}s)\nData: {location}")
                         LAST_SENT_TIME[address] = current_time
-                await asyncio.sleep(0.1)
             except Exception as e:
                 print(f"Lỗi ở send_location_handler: {e}!")
+        await asyncio.sleep(0.1)
 
 
 async def process_anchor(address):